@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     "rest_framework",
     "rest_framework_simplejwt",
@@ -59,7 +60,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "mis.authentication.RoleJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
@@ -68,6 +69,16 @@ REST_FRAMEWORK = {
         "rest_framework.filters.OrderingFilter",
         'django_filters.rest_framework.DjangoFilterBackend'
     ),
+    # orjson when it is installed, the DRF classes otherwise
+    "DEFAULT_RENDERER_CLASSES": (
+        "mis.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "mis.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 100,
 }
@@ -107,6 +118,66 @@ DATABASES = {
     }
 }
 
+# Connections are pooled per worker process. A sync gunicorn worker serves one request at a time and needs
+# a single connection, an ASGI worker runs the queries in threads and needs more.
+# Workers * POSTGRES_POOL_MAX_SIZE (twice that with a replica) must fit into max_connections of the server.
+# Without the pool connections are kept for POSTGRES_CONN_MAX_AGE seconds and checked before reuse
+
+if os.environ.get("POSTGRES_POOL", "True") == "True":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("POSTGRES_POOL_MIN_SIZE", 1)),
+            "max_size": int(os.environ.get("POSTGRES_POOL_MAX_SIZE", 4)),
+            "timeout": int(os.environ.get("POSTGRES_POOL_TIMEOUT", 10)),
+        }
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("POSTGRES_CONN_MAX_AGE", 60))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Optional streaming replica for the safe requests of the mis viewsets, see mis/routers.py
+# A user who has just written keeps reading from the primary for REPLICA_STICKY_SECONDS
+
+if os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("POSTGRES_REPLICA_DB", DATABASES["default"]["NAME"]),
+        "USER": os.environ.get("POSTGRES_REPLICA_USER", DATABASES["default"]["USER"]),
+        "PASSWORD": os.environ.get("POSTGRES_REPLICA_PASSWORD", DATABASES["default"]["PASSWORD"]),
+        "HOST": os.environ["POSTGRES_REPLICA_HOST"],
+        "PORT": os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+    }
+
+DATABASE_ROUTERS = ["mis.routers.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# locmem is per process and a write invalidates only its own worker, so without a shared cache (REDIS_URL)
+# cached directories live for a minute only and JWT claims are not trusted: token revocations would not reach
+# other workers, users are reloaded from the database once per AUTH_USER_CACHE_TTL seconds instead
+
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+    DIRECTORY_CACHE_TIMEOUT = int(os.environ.get("DIRECTORY_CACHE_TIMEOUT", 24 * 60 * 60))
+    AUTH_TRUST_TOKEN_CLAIMS = os.environ.get("AUTH_TRUST_TOKEN_CLAIMS", "True") == "True"
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+    DIRECTORY_CACHE_TIMEOUT = int(os.environ.get("DIRECTORY_CACHE_TIMEOUT", 60))
+    AUTH_TRUST_TOKEN_CLAIMS = os.environ.get("AUTH_TRUST_TOKEN_CLAIMS", "False") == "True"
+
+AUTH_USER_CACHE_SIZE = int(os.environ.get("AUTH_USER_CACHE_SIZE", 1024))
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", 30))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -153,6 +224,8 @@ AUTH_USER_MODEL = "mis.Users"
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
+    "TOKEN_OBTAIN_SERIALIZER": "mis.authentication.RoleTokenObtainPairSerializer",
+    "TOKEN_USER_CLASS": "mis.authentication.ClaimsUser",
 }
 
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
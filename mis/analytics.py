@@ -0,0 +1,18 @@
+from django.db import connection, transaction
+
+from mis.models import Consultations, ConsultationStats
+
+
+def rebuild_stats() -> int:
+    """Recomputes `ConsultationStats` from the consultations, returns the number of rows."""
+    stats, consultations = ConsultationStats._meta.db_table, Consultations._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # writes wait for the rebuild, so the triggers can't apply a change to the old numbers; reads go on
+        cursor.execute(f"LOCK TABLE {consultations} IN SHARE MODE")
+        cursor.execute(f"DELETE FROM {stats}")
+        cursor.execute(
+            f"INSERT INTO {stats} (clinic_id, doctor_id, day, status, count) "
+            f"SELECT clinic_id, doctor_id, (start_time AT TIME ZONE 'UTC')::date, status, count(*) "
+            f"FROM {consultations} GROUP BY 1, 2, 3, 4"
+        )
+        return cursor.rowcount
@@ -0,0 +1,114 @@
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.views import View
+from rest_framework import status
+from rest_framework.response import Response
+
+from mis import serializers
+from mis.renderers import FastJSONRenderer
+from mis.routers import allow_replica_reads, replica_reads
+from mis.slots import free_slots
+from mis.views import ConsultationViewSet, DoctorsViewSet
+
+
+class AsyncReadView(ABC, View):
+    """
+    Async GET endpoint with the authentication, permissions, filters, pagination and serializer of a DRF viewset.
+
+    Only authentication and permission checks run in a worker thread, queries go through the async ORM,
+    so a slow query does not hold a worker under ASGI.
+    """
+
+    viewset_class = None
+    action = None
+
+    async def get(self, request, *args, **kwargs):
+        view = self.viewset_class(
+            action=self.action, action_map={"get": self.action}, args=args, kwargs=kwargs, format_kwarg=None,
+            renderer_classes=[FastJSONRenderer],
+        )
+        view.request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        with replica_reads(request.method):
+            try:
+                await sync_to_async(view.initial)(view.request, *args, **kwargs)
+                allow_replica_reads(view.request.user)
+                response = await self.read(view, view.request, *args, **kwargs)
+            except Exception as exc:
+                response = view.handle_exception(exc)
+        response = view.finalize_response(view.request, response, *args, **kwargs)
+        return response.render()
+
+    @abstractmethod
+    async def read(self, view, request, *args, **kwargs):
+        """The response of the endpoint, after authentication and permission checks of `view`."""
+
+    async def get_object(self, view):
+        lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+        queryset = view.filter_queryset(view.get_queryset())
+        try:
+            obj = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError):
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        view.check_object_permissions(view.request, obj)
+        return obj
+
+
+class AsyncConsultationListView(AsyncReadView):
+    viewset_class = ConsultationViewSet
+    action = "list"
+
+    async def read(self, view, request, *args, **kwargs):
+        if not view.has_list_validators(request):
+            return await self.read_list(view, request)
+        state = await view.list_state_queryset().aaggregate(**view.get_list_state_aggregates())
+        view.list_count = state["count"]
+        headers = view.list_validators(request, state)
+        response = view.not_modified_response(request, headers)
+        if response is None:
+            response = await self.read_list(view, request)
+        return view.add_validators(response, headers)
+
+    async def read_list(self, view, request):
+        values = view.get_values_serializer()
+        queryset = values.queryset(view.filter_queryset(view.get_queryset()))
+        page = await view.paginator.apaginate_queryset(queryset, request, view)
+        rows = [row async for row in queryset] if page is None else page
+        if values.many_related:
+            # the clinic ids of expanded doctors are a query of their own
+            data = await sync_to_async(values.to_representation)(rows)
+        else:
+            data = values.to_representation(rows)
+        return Response(data) if page is None else view.get_paginated_response(data)
+
+
+class AsyncConsultationDetailView(AsyncReadView):
+    viewset_class = ConsultationViewSet
+    action = "retrieve"
+
+    async def read(self, view, request, *args, **kwargs):
+        obj = await self.get_object(view)
+        return Response(view.get_serializer(obj).data, headers={"ETag": obj.etag})
+
+
+class AsyncDoctorFreeSlotsView(AsyncReadView):
+    viewset_class = DoctorsViewSet
+    action = "free_slots"
+
+    async def read(self, view, request, *args, **kwargs):
+        doctor = await self.get_object(view)
+        query = serializers.FreeSlotsQuerySerializer(data=request.query_params)
+        # the clinic is looked up by the serializer field
+        await sync_to_async(query.is_valid)(raise_exception=True)
+        start, end = query.validated_data["from"], query.validated_data["to"]
+        clinic = query.validated_data.get("clinic")
+        if clinic and not await doctor.clinics.filter(pk=clinic.pk).aexists():
+            return Response({"error": "Doctor does not work in this clinic"}, status=status.HTTP_400_BAD_REQUEST)
+
+        busy = [interval async for interval in view.busy_intervals(doctor, start, end)]
+        slots = free_slots(busy, start, end, timedelta(minutes=query.validated_data["duration"]))
+        data = [{"start_time": slot_start, "end_time": slot_end} for slot_start, slot_end in slots]
+        return Response(serializers.FreeSlotSerializer(data, many=True).data)
@@ -0,0 +1,144 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+AUTH_CLAIMS = ("role", "is_staff")
+AUTH_VERSION_CLAIM = "auth_version"
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in AUTH_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token[AUTH_VERSION_CLAIM] = user.auth_version
+        # the first requests with the token don't read the version from the database
+        cache.add(_version_key(user.pk), user.auth_version, _version_timeout())
+        return token
+
+
+class ClaimsUser(TokenUser):
+    """A user built from the token claims, enough for `IsAdmin`/`IsAdminOrReadOnly`."""
+
+    @cached_property
+    def role(self):
+        return self.token.get("role")
+
+
+class UserCache:
+    """Bounded LRU of users with a TTL, per process. Every caller gets a copy of its own."""
+
+    def __init__(self):
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            user, expires = self._users.get(user_id, (None, 0))
+            if expires < time.monotonic():
+                self._users.pop(user_id, None)
+                return None
+            self._users.move_to_end(user_id)
+            return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (copy.copy(user), time.monotonic() + settings.AUTH_USER_CACHE_TTL)
+            self._users.move_to_end(user_id)
+            while len(self._users) > settings.AUTH_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+def _version_key(user_id):
+    return f"auth:version:{user_id}"
+
+
+def _version_timeout():
+    return int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def get_auth_version(user_id) -> str | None:
+    """`Users.auth_version` through the Django cache, None if there is no such user."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = get_user_model().objects.filter(pk=user_id).values_list("auth_version", flat=True).first()
+        if version is not None:
+            cache.set(_version_key(user_id), version, _version_timeout())
+    return version
+
+
+def revoke_tokens(user):
+    """
+    Reject the tokens issued to the user so far, their claims (role, is_staff, is_active) are outdated.
+
+    Tokens carry the auth version current at login. The new one is stored in the database and the cache holds
+    a copy only, so a lost cache entry can't make the old tokens valid again. A deleted user has no version.
+    """
+    user.auth_version = uuid.uuid4().hex
+    type(user).objects.filter(pk=user.pk).update(auth_version=user.auth_version)
+    # until the commit the version is read from the database, the new one is cached after it
+    user_cache.discard(user.pk)
+    cache.delete(_version_key(user.pk))
+
+    def _revoke():
+        user_cache.discard(user.pk)
+        cache.set(_version_key(user.pk), user.auth_version, _version_timeout())
+
+    transaction.on_commit(_revoke)
+
+
+class RoleJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication without a query per request.
+
+    Tokens carrying the role claims are checked against the auth version of the user, read through the Django
+    cache. With `AUTH_TRUST_TOKEN_CLAIMS` the user is built from the claims alone, otherwise it is loaded through
+    a bounded in-process cache that lives `AUTH_USER_CACHE_TTL` seconds. Older tokens load the user every time.
+    """
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in AUTH_CLAIMS):
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        version = get_auth_version(user_id)
+        if version is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if validated_token.get(AUTH_VERSION_CLAIM) != version:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        if settings.AUTH_TRUST_TOKEN_CLAIMS:
+            return ClaimsUser(validated_token)
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        elif not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
@@ -0,0 +1,166 @@
+import hashlib
+import time
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, Max, Sum
+from django.db.models.functions import Extract
+from django.http import QueryDict
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from mis.sparse import EXPAND_PARAM, FIELDS_PARAM
+
+# query parameter attributes of the DRF paginators
+PAGINATION_PARAMS = (
+    "limit_query_param", "offset_query_param", "page_query_param", "page_size_query_param", "cursor_query_param",
+)
+
+
+def _state_key(namespace):
+    return f"{namespace}:state"
+
+
+def get_state(namespace) -> tuple[str, int]:
+    """(version, last modified timestamp) of a cached namespace, a cold cache starts a new version."""
+    state = cache.get(_state_key(namespace))
+    if state is None:
+        state = (uuid.uuid4().hex, int(time.time()))
+        if not cache.add(_state_key(namespace), state, settings.DIRECTORY_CACHE_TIMEOUT):
+            state = cache.get(_state_key(namespace), state)
+    return state
+
+
+def invalidate(namespace):
+    cache.set(_state_key(namespace), (uuid.uuid4().hex, int(time.time())), settings.DIRECTORY_CACHE_TIMEOUT)
+
+
+def invalidate_on_commit(namespace):
+    # once right away and once more after commit, so a read racing with the transaction can't keep stale data
+    invalidate(namespace)
+    transaction.on_commit(lambda: invalidate(namespace))
+
+
+class CachedReadMixin:
+    """
+    Caches `list`/`retrieve` payloads of a rarely changing resource in Django's cache.
+
+    Every response carries `ETag`/`Last-Modified` derived from the namespace version, conditional requests
+    are answered with 304 from the cache alone. Only `If-None-Match` is honoured: the stamps of `Last-Modified`
+    are whole seconds, a write in the same second as a read would not move it.
+    Writes must call `invalidate_on_commit(cache_namespace)`, e.g. from model signals.
+    """
+
+    cache_namespace = None
+
+    def perform_authentication(self, request):
+        # reads that the permissions allow anonymously don't load the user, unless it sent credentials:
+        # a malformed or expired token is rejected, not served as anonymous
+        if "Authorization" in request.headers:
+            super().perform_authentication(request)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def get_cache_query_params(self) -> set[str]:
+        """Query parameters that change the payload: pagination, ordering and sparse fields, the rest is ignored."""
+        names = {FIELDS_PARAM, EXPAND_PARAM}
+        for name in PAGINATION_PARAMS:
+            if getattr(self.paginator, name, None):
+                names.add(getattr(self.paginator, name))
+        for backend in self.filter_backends:
+            if getattr(backend, "ordering_param", None):
+                names.add(backend.ordering_param)
+        return names
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        # any other parameter would be a new cache entry for the day, e.g. ?x=<random> of an anonymous client
+        names = self.get_cache_query_params()
+        query = urlencode(sorted(item for item in request.query_params.lists() if item[0] in names), doseq=True)
+        # the handler sees the same query as the key, e.g. in the pagination links
+        request._request.GET = QueryDict(query)
+        request._request.META["QUERY_STRING"] = query
+
+        version, modified = get_state(self.cache_namespace)
+        key = f"{self.cache_namespace}:{version}:{request.accepted_media_type}:{request.path}?{query}"
+        etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+        headers = {"ETag": etag, "Last-Modified": http_date(modified)}
+
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return Response(status=not_modified.status_code, headers=headers)
+
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, settings.DIRECTORY_CACHE_TIMEOUT)
+            data = response.data
+        return Response(data, headers=headers)
+
+
+class ConditionalListMixin:
+    """
+    `ETag`/`Last-Modified` of `list` responses from one aggregate over the filtered queryset, a matching
+    `If-None-Match` is answered with 304 before the page is queried and serialized.
+
+    The ETag covers the count and the sum of `updated_at` of the rows, so deletes and updates committed with
+    an older `updated_at` than the newest one change it as well. `Last-Modified` is informative only: the newest
+    `updated_at` does not move on deletes, so `If-Modified-Since` is not answered with 304.
+    The count is passed to the pagination as `list_count`, so a limit/offset page costs no extra query.
+    Keyset pages (they never scan the whole filtered set) and expanded relations (not covered) skip validation.
+    """
+
+    modified_field = "updated_at"
+
+    def list(self, request, *args, **kwargs):
+        if not self.has_list_validators(request):
+            return super().list(request, *args, **kwargs)
+        state = self.list_state_queryset().aggregate(**self.get_list_state_aggregates())
+        self.list_count = state["count"]
+        headers = self.list_validators(request, state)
+        response = self.not_modified_response(request, headers)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return self.add_validators(response, headers)
+
+    def has_list_validators(self, request) -> bool:
+        cursor_param = getattr(self.paginator, "cursor_query_param", None)
+        return EXPAND_PARAM not in request.query_params and cursor_param not in request.query_params
+
+    def list_state_queryset(self):
+        return self.filter_queryset(self.get_queryset()).order_by()
+
+    def get_list_state_aggregates(self):
+        return {
+            "count": Count("pk"),
+            "modified": Max(self.modified_field),
+            "total": Sum(Extract(self.modified_field, "epoch"), output_field=DecimalField()),
+        }
+
+    def list_validators(self, request, state) -> dict[str, str]:
+        key = f"{state['count']}:{state['total']}:{request.accepted_media_type}:{request.get_full_path()}"
+        headers = {"ETag": f'"{hashlib.md5(key.encode()).hexdigest()}"'}
+        if state["modified"] is not None:
+            headers["Last-Modified"] = http_date(state["modified"].timestamp())
+        return headers
+
+    def not_modified_response(self, request, headers):
+        not_modified = get_conditional_response(request, etag=headers["ETag"])
+        if not_modified is not None:
+            return Response(status=not_modified.status_code, headers=headers)
+        return None
+
+    def add_validators(self, response, headers):
+        if response.status_code == 200:
+            for name, value in headers.items():
+                response[name] = value
+        return response
@@ -0,0 +1,44 @@
+import csv
+import json
+from typing import Iterable, Iterator
+
+from rest_framework.fields import DateTimeField
+
+from mis.serializers import ConsultationsSerializer
+
+CHUNK_SIZE = 2000
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# the columns of ConsultationsSerializer, so an export can be fed back to the importer
+FIELDS = ("id",) + ConsultationsSerializer.Meta.fields
+COLUMNS = tuple(f"{field}_id" if field in ("doctor", "patient", "clinic") else field for field in FIELDS)
+DATETIME_FIELDS = {"start_time", "end_time", "created_at"}
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _representation(rows: Iterable[tuple]) -> Iterator[dict]:
+    to_representation = DateTimeField().to_representation
+    datetime_positions = [i for i, field in enumerate(FIELDS) if field in DATETIME_FIELDS]
+    for row in rows:
+        row = list(row)
+        for i in datetime_positions:
+            if row[i] is not None:
+                row[i] = to_representation(row[i])
+        yield dict(zip(FIELDS, row))
+
+
+def export_consultations(rows: Iterable[tuple], fmt: str) -> Iterator[str]:
+    """Encode `COLUMNS` value rows lazily, one line per row."""
+    records = _representation(rows)
+    if fmt == "csv":
+        writer = csv.DictWriter(_Echo(), fieldnames=FIELDS)
+        yield writer.writeheader()
+        for record in records:
+            yield writer.writerow(record)
+    else:
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from functools import lru_cache
+from operator import itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from mis.sparse import EXPAND_PARAM, FIELDS_PARAM
+
+# fields whose to_representation() returns database values of .values() as they are
+PLAIN_FIELDS = (
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+    serializers.ReadOnlyField,
+)
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path of a `ModelSerializer` for lists: rows come from `.values()` and every field is rendered
+    by a converter picked once per field, without model instances and the per field machinery of DRF.
+
+    The representation is the same as the one of `serializer_class(instances, many=True)`. Model fields,
+    nested serializers of to-one relations and primary keys of to-one and many-to-many relations are supported.
+    """
+
+    def __init__(self, serializer):
+        self.model = serializer.Meta.model
+        self.keys = [self.model._meta.pk.attname]
+        self.many_related = {}
+        self.plan = self._plan(serializer, self.model, "")
+
+    @classmethod
+    def for_serializer(cls, serializer_class, fields=None, expand=()):
+        """
+        The fast path of `serializer_class` with the `fields` and `expand` of `SparseFieldsMixin`,
+        None if one of the fields has none.
+        """
+        return _values_serializer(cls, serializer_class, fields, expand)
+
+    def _plan(self, serializer, model, prefix):
+        plan = []
+        for field in serializer._readable_fields:
+            key = prefix + "__".join(field.source_attrs)
+            if isinstance(field, serializers.BaseSerializer) and not isinstance(field, serializers.ListSerializer):
+                plan.append((field.field_name, key, self._plan(field, field.Meta.model, f"{key}__")))
+            elif isinstance(field, ManyRelatedField) and _is_pk_field(field.child_relation):
+                pk_key = prefix + model._meta.pk.attname
+                self._add_key(pk_key)
+                self.many_related[key] = (model._meta.get_field(field.source), pk_key)
+                plan.append((field.field_name, key, None))
+            elif isinstance(field, (*PLAIN_FIELDS, serializers.DateTimeField)) or _is_pk_field(field):
+                self._add_key(key)
+                plan.append((field.field_name, key, field))
+            else:
+                raise ImproperlyConfigured(f"{field.field_name}: {type(field).__name__} has no fast path")
+        return plan
+
+    def _add_key(self, key):
+        if key not in self.keys:
+            self.keys.append(key)
+
+    def queryset(self, queryset):
+        # the ordering fields are kept for the keyset pagination cursor
+        ordering = [
+            name.lstrip("-") for name in queryset.query.order_by or self.model._meta.ordering if isinstance(name, str)
+        ]
+        keys = self.keys + [name for name in ordering if name not in self.keys]
+        return queryset.prefetch_related(None).values(*keys)
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        related = {key: self._related_ids(field, pk_key, rows) for key, (field, pk_key) in self.many_related.items()}
+        build = self._compile(self.plan, related)
+        return [build(row) for row in rows]
+
+    def _related_ids(self, field, pk_key, rows):
+        through = field.remote_field.through
+        source, target = f"{field.m2m_field_name()}_id", f"{field.m2m_reverse_field_name()}_id"
+        ids = defaultdict(list)
+        pairs = through.objects.filter(**{f"{source}__in": {row[pk_key] for row in rows}})
+        for pk, related_pk in pairs.order_by(target).values_list(source, target):
+            ids[pk].append(related_pk)
+        return ids
+
+    def _compile(self, plan, related):
+        # converters are bound per call, the time zone of a DateTimeField follows the active one
+        getters = []
+        for name, key, field in plan:
+            if isinstance(field, list):
+                getters.append((name, self._compile(field, related)))
+            elif field is None:
+                getters.append((name, _many_getter(related[key], self.many_related[key][1])))
+            else:
+                getters.append((name, _getter(field, key)))
+        return lambda row: {name: get(row) for name, get in getters}
+
+
+@lru_cache(maxsize=256)
+def _values_serializer(cls, serializer_class, fields, expand):
+    try:
+        return cls(serializer_class(context={FIELDS_PARAM: fields, EXPAND_PARAM: expand}))
+    except ImproperlyConfigured:
+        return None
+
+
+def _is_pk_field(field):
+    return isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None
+
+
+def _getter(field, key):
+    if isinstance(field, PLAIN_FIELDS) or _is_pk_field(field):
+        return itemgetter(key)
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+        if output_format is not None and output_format.lower() == ISO_8601 and timezone is not None:
+            return _datetime_getter(key, timezone)
+
+    def get(row):
+        value = row[key]
+        return None if value is None else field.to_representation(value)
+
+    return get
+
+
+def _datetime_getter(key, timezone):
+    # DateTimeField.to_representation() without the format and time zone lookups per value
+    def get(row):
+        value = row[key]
+        if value is None:
+            return None
+        value = value.astimezone(timezone).isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+
+    return get
+
+
+def _many_getter(ids, pk):
+    return lambda row: ids.get(row[pk], [])
+
+
+class ValuesListMixin:
+    """`list` through `ValuesSerializer` of the serializer class, other actions are left as they are."""
+
+    def get_values_serializer(self):
+        context = self.get_serializer_context()
+        return ValuesSerializer.for_serializer(
+            self.get_serializer_class(), context.get(FIELDS_PARAM), context.get(EXPAND_PARAM, ())
+        )
+
+    def list(self, request, *args, **kwargs):
+        values = self.get_values_serializer()
+        if values is None:
+            return super().list(request, *args, **kwargs)
+        queryset = values.queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(values.to_representation(queryset))
+        return self.get_paginated_response(values.to_representation(page))
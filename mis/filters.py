@@ -0,0 +1,67 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import BooleanField, Func, Q
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from mis.models import FullName, Users
+
+
+class TrigramSearchFilter(BaseFilterBackend):
+    """
+    Typo-tolerant search by full name over the pg_trgm index on `Users`.
+
+    `trigram_search_fields` on the view maps a search type to the path of a user, e.g.
+    `{"doctor": "doctor__user"}`; `?search_type=doctor` narrows the search to one of them.
+    With `trigram_search_rank = True` (a single path only) the results are ordered by similarity.
+    """
+
+    search_param = api_settings.SEARCH_PARAM
+    search_type_param = "search_type"
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, "").strip()
+        fields = getattr(view, "trigram_search_fields", {})
+        if not term or not fields:
+            return queryset
+
+        search_type = request.query_params.get(self.search_type_param)
+        if search_type in fields:
+            fields = {search_type: fields[search_type]}
+
+        if getattr(view, "trigram_search_rank", False):
+            (path,) = fields.values()
+            return (
+                queryset.annotate(full_name=FullName(f"{path}__"))
+                .filter(full_name__trigram_word_similar=term)
+                .annotate(search_rank=TrigramWordSimilarity(term, "full_name"))
+                .order_by("-search_rank", "pk")
+            )
+
+        # matching users are found with the index first and every path is compared against an array of their
+        # related ids, evaluated once, so each alternative of the OR can use its own (doctor|patient, ...) index
+        users = Users.objects.annotate(full_name=FullName()).filter(full_name__trigram_word_similar=term)
+        condition = Q()
+        for path in fields.values():
+            relation, _, user_path = path.rpartition("__")
+            if relation:
+                related = queryset.model._meta.get_field(relation).related_model.objects
+                condition |= Q(AnyOf(relation, related.filter(**{f"{user_path}__in": users}).values("pk")))
+            else:
+                condition |= Q(AnyOf(user_path, users.values("pk")))
+        return queryset.filter(condition)
+
+
+class AnyOf(Func):
+    """`expression = ANY(ARRAY(subquery))`, unlike IN (subquery) it can be used as an index condition."""
+
+    output_field = BooleanField()
+
+    def __init__(self, expression, queryset):
+        super().__init__(expression, ArraySubquery(queryset))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        expression, array = self.get_source_expressions()
+        expression_sql, expression_params = compiler.compile(expression)
+        array_sql, array_params = compiler.compile(array)
+        return f"{expression_sql} = ANY({array_sql})", (*expression_params, *array_params)
@@ -0,0 +1,164 @@
+import bisect
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.db import DatabaseError, connection, transaction
+from rest_framework.serializers import PrimaryKeyRelatedField
+
+from mis.models import Clinics, Consultations, Doctors, Patients
+from mis.serializers import ConsultationImportSerializer, ConsultationOverlap
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+FORMATS = ("csv", "ndjson")
+
+STAGE_TABLE = "consultations_import"
+COLUMNS = ("doctor_id", "patient_id", "clinic_id", "start_time", "end_time", "status", "notes")
+RELATED = (("doctor", Doctors), ("patient", Patients), ("clinic", Clinics))
+DEFAULT_STATUS = Consultations._meta.get_field("status").get_default()
+
+
+def read_records(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, dict | None]]:
+    """(row number, record) pairs from CSV with a header or NDJSON; record is None for an unparsable line."""
+    if fmt == "csv":
+        for row_no, record in enumerate(csv.DictReader(lines), start=1):
+            # empty CSV cells mean "not set", like missing keys in JSON
+            yield row_no, {key: value for key, value in record.items() if value not in ("", None)}
+    elif fmt == "ndjson":
+        for row_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row_no, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}")
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row_no, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_no, "errors": errors})
+
+    def as_dict(self):
+        return {"created": self.created, "failed": self.failed, "errors": self.errors}
+
+
+def import_consultations(records: Iterable[tuple[int, dict | None]], chunk_size: int = CHUNK_SIZE) -> ImportResult:
+    """
+    Validate and load consultations chunk by chunk, so memory depends on `chunk_size` only.
+
+    Every chunk is copied into a temporary table and moved with one INSERT ... ON CONFLICT DO NOTHING,
+    rows rejected by the overlap constraint or by validation are reported and don't abort the import.
+    """
+    result = ImportResult()
+    records = iter(records)
+    while chunk := list(islice(records, chunk_size)):
+        rows = _validate_chunk(chunk, result)
+        if rows:
+            _load_chunk(rows, result)
+    return result
+
+
+def _validate_chunk(chunk, result):
+    rows = []
+    for row_no, record in chunk:
+        if record is None:
+            result.add_error(row_no, {"non_field_errors": ["Malformed record."]})
+            continue
+        serializer = ConsultationImportSerializer(data=record)
+        if not serializer.is_valid():
+            result.add_error(row_no, serializer.errors)
+            continue
+        data = serializer.validated_data
+        data["end_time"] = Consultations.default_end_time(data["start_time"], data.get("end_time"))
+        rows.append((row_no, data))
+
+    missing = {}
+    for field, model in RELATED:
+        ids = {data[field] for _, data in rows}
+        missing[field] = ids - set(model.objects.filter(pk__in=ids).values_list("pk", flat=True))
+
+    valid, booked = [], {}
+    for row_no, data in rows:
+        errors = {
+            field: [PrimaryKeyRelatedField.default_error_messages["does_not_exist"].format(pk_value=data[field])]
+            for field in missing
+            if data[field] in missing[field]
+        }
+        # overlaps within the chunk are found here, the database only compares with the stored consultations:
+        # the consultation_no_overlap trigger would reject the whole chunk for two rows in different months
+        intervals = booked.setdefault(data["doctor"], [])
+        if not errors and _overlaps(intervals, data["start_time"], data["end_time"]):
+            errors = {"non_field_errors": [ConsultationOverlap.default_detail]}
+        if errors:
+            result.add_error(row_no, errors)
+            continue
+        bisect.insort(intervals, (data["start_time"], data["end_time"]))
+        valid.append((row_no, data))
+    return valid
+
+
+def _overlaps(intervals, start, end):
+    """Whether [start, end) overlaps or starts with one of the sorted, disjoint `intervals` of a doctor."""
+    index = bisect.bisect_left(intervals, (start,))
+    if index < len(intervals) and (intervals[index][0] < end or intervals[index][0] == start):
+        return True
+    return index > 0 and intervals[index - 1][1] > start
+
+
+def _load_chunk(rows, result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_no, data in rows:
+        writer.writerow((
+            row_no, data["doctor"], data["patient"], data["clinic"], data["start_time"].isoformat(),
+            data["end_time"].isoformat(), data.get("status", DEFAULT_STATUS), data.get("notes"),
+        ))
+
+    columns = ", ".join(COLUMNS)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} ("
+                "row_no bigint, doctor_id bigint, patient_id bigint, clinic_id bigint, "
+                "start_time timestamptz, end_time timestamptz, status varchar(30), notes text"
+                ") ON COMMIT DROP"
+            )
+            cursor.execute(f"TRUNCATE {STAGE_TABLE}")
+            with cursor.copy(f"COPY {STAGE_TABLE} (row_no, {columns}) FROM STDIN WITH (FORMAT csv)") as copy:
+                copy.write(buffer.getvalue())
+            # rows overlapping existing consultations are skipped by the exclusion constraints, and by the filter
+            # when the consultation is in another month, which the trigger would reject with the whole chunk
+            cursor.execute(
+                f"WITH inserted AS ("
+                f"  INSERT INTO {Consultations._meta.db_table} ({columns}, created_at, updated_at)"
+                f"  SELECT {columns}, now(), now() FROM {STAGE_TABLE}"
+                "   WHERE NOT mis_consultation_overlaps_other_months(NULL, doctor_id, start_time, end_time)"
+                "   ORDER BY row_no"
+                "  ON CONFLICT DO NOTHING RETURNING doctor_id, start_time"
+                ") "
+                f"SELECT row_no FROM {STAGE_TABLE} s WHERE NOT EXISTS ("
+                "  SELECT 1 FROM inserted i WHERE i.doctor_id = s.doctor_id AND i.start_time = s.start_time"
+                ") ORDER BY row_no"
+            )
+            rejected = [row_no for row_no, in cursor.fetchall()]
+    except DatabaseError as e:
+        for row_no, _ in rows:
+            result.add_error(row_no, {"non_field_errors": [str(e).strip()]})
+        return
+
+    result.created += len(rows) - len(rejected)
+    for row_no in rejected:
+        result.add_error(row_no, {"non_field_errors": [ConsultationOverlap.default_detail]})
@@ -0,0 +1,302 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, nullcontext
+from datetime import datetime, timedelta, timezone
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from mis import seeding
+from mis.models import Clinics, Consultations, Doctors, Patients, Users
+
+BENCH_USERNAME = "bench.admin"
+BENCH_PASSWORD = "bench-password"
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _endpoint(name, method, path, data=None, content_type=None, write=False, auth=True):
+    return dict(name=name, method=method, path=path, data=data, content_type=content_type, write=write, auth=auth)
+
+
+def percentile(values, share):
+    """Nearest rank percentile of sorted `values`."""
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency percentiles, throughput and queries per request of every endpoint of mis/urls.py "
+        "and /api/token/ in process, against the configured database, and saves the results as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", help="JSON file for the results, e.g. bench/$(git rev-parse --short HEAD).json")
+        parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+        parser.add_argument("--requests", type=int, default=200, help="per endpoint")
+        parser.add_argument("--warmup", type=int, default=10, help="requests per endpoint before measuring")
+        parser.add_argument("--concurrency", type=int, default=1, help="client threads, each with its connection")
+        parser.add_argument("--only", action="append", help="endpoint names to run, all by default")
+        parser.add_argument(
+            "--seed", action="store_true", help="seed an empty database first like seed_mis, sized by the options below"
+        )
+        for table, count in seeding.DEFAULT_SIZES.items():
+            parser.add_argument(f"--{table}", type=int, default=count)
+        parser.add_argument("--workers", type=int, default=os.cpu_count(), help="seeding processes")
+
+    def handle(self, *args, **options):
+        # the test client's host; without query logging of DEBUG, which would slow every query down
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            self.bench(**options)
+
+    def bench(self, output, compare, requests, warmup, concurrency, only, seed, workers, **options):
+        if seed:
+            if Consultations.objects.exists():
+                self.stdout.write("The database has consultations already, not seeding")
+            else:
+                sizes = {table: options[table] for table in seeding.DEFAULT_SIZES}
+                call_command("seed_mis", workers=workers, stdout=self.stdout, **sizes)
+
+        ids = self.sample_ids()
+        token = self.get_token()
+        endpoints = [endpoint for endpoint in self.endpoints(ids) if not only or endpoint["name"] in only]
+        if not endpoints:
+            raise CommandError(f"No endpoints named {', '.join(only)}")
+
+        baseline = {}
+        if compare:
+            with open(compare) as file:
+                baseline = {result["name"]: result for result in json.load(file)["endpoints"]}
+
+        self.stdout.write(
+            f"{'endpoint':<32} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}"
+            + (f" {'p50 vs base':>12}" if baseline else "")
+        )
+        results = []
+        for endpoint in endpoints:
+            if warmup:
+                self.run(endpoint, token, warmup, 1)
+            result = {**endpoint, **self.run(endpoint, token, requests, concurrency)}
+            results.append(result)
+            line = (
+                f"{endpoint['name']:<32} {result['rps']:>8.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['p99_ms']:>8.2f} {result['queries_mean']:>8.1f} {result['errors']:>7}"
+            )
+            if endpoint["name"] in baseline:
+                line += f" {result['p50_ms'] / baseline[endpoint['name']]['p50_ms']:>11.2f}x"
+            self.stdout.write(line)
+
+        if output:
+            report = {
+                "meta": self.meta(requests, warmup, concurrency),
+                "dataset": self.dataset(),
+                "endpoints": results,
+            }
+            with open(output, "w") as file:
+                json.dump(report, file, indent=2, default=str)
+            self.stdout.write(self.style.SUCCESS(f"Saved {output}"))
+
+    def sample_ids(self):
+        # a waiting consultation has a doctor with consultations and a valid next status
+        consultation = Consultations.objects.filter(status="waiting").order_by("pk").first()
+        if consultation is None:
+            raise CommandError("No waiting consultations, seed the database with --seed")
+        user, _ = Users.objects.get_or_create(username=BENCH_USERNAME, defaults={"role": "admin"})
+        if not user.check_password(BENCH_PASSWORD):
+            user.set_password(BENCH_PASSWORD)
+            user.save(update_fields=["password"])
+        doctor = Doctors.objects.select_related("user").get(pk=consultation.doctor_id)
+        return {
+            "consultation": consultation.pk,
+            "doctor": doctor.pk,
+            "doctor_last_name": doctor.user.last_name,
+            "patient": consultation.patient_id,
+            "clinic": consultation.clinic_id,
+        }
+
+    def get_token(self):
+        credentials = {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}
+        response = APIClient().post("/api/token/", credentials, format="json")
+        if response.status_code != 200:
+            raise CommandError(f"Can't get a token: {response.status_code} {response.content[:200]}")
+        return response.data["access"]
+
+    def endpoints(self, ids):
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        week = f"from={today:%Y-%m-%dT%H:%M:%SZ}&to={today + timedelta(days=7):%Y-%m-%dT%H:%M:%SZ}"
+        days = f"from={today - timedelta(days=30):%Y-%m-%d}&to={today:%Y-%m-%d}"
+        consultation, doctor, patient, clinic = ids["consultation"], ids["doctor"], ids["patient"], ids["clinic"]
+        # far enough from the seeded schedule not to overlap
+        free_time = (today + timedelta(days=3650)).replace(hour=3)
+        new_consultation = {"doctor": doctor, "patient": patient, "clinic": clinic, "start_time": free_time.isoformat()}
+        person = {"first_name": "Бенч", "last_name": "Тестов", "middle_name": "Иванович", "email": "bench@example.com"}
+        clinic_data = {"name": "Бенч", "legal_address": "ул. Ленина, 1", "actual_address": "ул. Мира, 1"}
+        doctor_data = {"user": person, "specialization": "Терапевт", "clinics": [clinic]}
+        imported = json.dumps({**new_consultation, "start_time": (free_time + timedelta(hours=1)).isoformat()})
+        last_name = ids["doctor_last_name"]
+        credentials = {"username": BENCH_USERNAME, "password": BENCH_PASSWORD}
+        active = "status__in=waiting,confirmed&ordering=start_time"
+
+        return [
+            _endpoint("token", "POST", "/api/token/", credentials, auth=False),
+            _endpoint("clinics.list", "GET", "/api/clinics/"),
+            _endpoint("clinics.detail", "GET", f"/api/clinics/{clinic}/"),
+            _endpoint("users.list", "GET", "/api/users/"),
+            _endpoint("users.search", "GET", f"/api/users/?search={last_name}"),
+            _endpoint("users.detail", "GET", f"/api/users/{patient}/"),
+            _endpoint("doctors.list", "GET", "/api/doctors/"),
+            _endpoint("doctors.detail", "GET", f"/api/doctors/{doctor}/"),
+            _endpoint("doctors.free_slots", "GET", f"/api/doctors/{doctor}/free-slots/?{week}"),
+            _endpoint("consultations.list", "GET", "/api/consultations/"),
+            _endpoint("consultations.cursor", "GET", "/api/consultations/?cursor=&limit=50"),
+            _endpoint("consultations.status", "GET", f"/api/consultations/?{active}"),
+            _endpoint("consultations.search", "GET", f"/api/consultations/?search={last_name}"),
+            _endpoint("consultations.sparse", "GET", "/api/consultations/?fields=start_time,doctor.user&expand=doctor"),
+            _endpoint("consultations.detail", "GET", f"/api/consultations/{consultation}/"),
+            _endpoint("consultations.calendar", "GET", f"/api/consultations/calendar/?clinic={clinic}&{week}"),
+            _endpoint("consultations.export", "GET", f"/api/consultations/export/?doctor__user__last_name={last_name}"),
+            _endpoint("analytics", "GET", f"/api/analytics/?{days}&clinic={clinic}"),
+            _endpoint("async.consultations.list", "GET", "/api/async/consultations/"),
+            _endpoint("async.consultations.detail", "GET", f"/api/async/consultations/{consultation}/"),
+            _endpoint("async.doctors.free_slots", "GET", f"/api/async/doctors/{doctor}/free-slots/?{week}"),
+            # writes are rolled back, so every request sees the same data; DELETE is left out,
+            # it would measure the cascade over the dataset
+            _endpoint("clinics.create", "POST", "/api/clinics/", clinic_data, write=True),
+            _endpoint("clinics.update", "PATCH", f"/api/clinics/{clinic}/", clinic_data, write=True),
+            _endpoint("users.create", "POST", "/api/users/", {"user": person}, write=True),
+            _endpoint("users.update", "PATCH", f"/api/users/{patient}/", {"user": person}, write=True),
+            _endpoint("doctors.create", "POST", "/api/doctors/", doctor_data, write=True),
+            _endpoint("doctors.update", "PATCH", f"/api/doctors/{doctor}/", {"user": person}, write=True),
+            _endpoint("consultations.create", "POST", "/api/consultations/", new_consultation, write=True),
+            _endpoint(
+                "consultations.update", "PATCH", f"/api/consultations/{consultation}/", {"notes": "Бенч"}, write=True
+            ),
+            _endpoint(
+                "consultations.change_status", "POST", f"/api/consultations/{consultation}/change_status/",
+                {"status": "confirmed"}, write=True,
+            ),
+            _endpoint(
+                "consultations.bulk_status", "POST", "/api/consultations/change_status/",
+                {"status": "confirmed", "ids": [consultation]}, write=True,
+            ),
+            _endpoint(
+                "consultations.import", "POST", "/api/consultations/import/", imported,
+                content_type="application/x-ndjson", write=True,
+            ),
+        ]
+
+    def run(self, endpoint, token, requests, concurrency):
+        latencies, queries, statuses = [], [], Counter()
+        lock = threading.Lock()
+
+        def worker(count):
+            client = APIClient()
+            if endpoint["auth"]:
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+            counter = QueryCounter()
+            try:
+                with ExitStack() as stack:
+                    for alias in connections:
+                        stack.enter_context(connections[alias].execute_wrapper(counter))
+                    for _ in range(count):
+                        counter.count = 0
+                        started = time.perf_counter()
+                        status_code = self.request(client, endpoint)
+                        latency = time.perf_counter() - started
+                        with lock:
+                            latencies.append(latency)
+                            queries.append(counter.count)
+                            statuses[status_code] += 1
+            finally:
+                if threading.current_thread() is not threading.main_thread():
+                    connections.close_all()
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            worker(requests)
+        else:
+            threads = [
+                threading.Thread(target=worker, args=(requests // concurrency + (i < requests % concurrency),))
+                for i in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "requests": len(latencies),
+            "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "errors": sum(count for code, count in statuses.items() if code >= 400),
+            "rps": len(latencies) / elapsed,
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries_mean": sum(queries) / len(queries),
+            "queries_max": max(queries),
+        }
+
+    def request(self, client, endpoint):
+        method = getattr(client, endpoint["method"].lower())
+        if endpoint["method"] == "GET":
+            kwargs = {}
+        elif endpoint["content_type"]:
+            kwargs = {"data": endpoint["data"], "content_type": endpoint["content_type"]}
+        else:
+            kwargs = {"data": endpoint["data"], "format": "json"}
+        with transaction.atomic() if endpoint["write"] else nullcontext():
+            response = method(endpoint["path"], **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            if endpoint["write"]:
+                transaction.set_rollback(True)
+        return response.status_code
+
+    def meta(self, requests, warmup, concurrency):
+        try:
+            commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            "commit": commit,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "requests": requests,
+            "warmup": warmup,
+            "concurrency": concurrency,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "postgresql": connection.pg_version,
+            "databases": sorted(connections),
+        }
+
+    def dataset(self):
+        return {
+            "clinics": Clinics.objects.count(),
+            "doctors": Doctors.objects.count(),
+            "patients": Patients.objects.count(),
+            "consultations": Consultations.objects.count(),
+        }
@@ -0,0 +1,103 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.crypto import get_random_string
+from rest_framework.test import APIClient
+
+from mis.models import Clinics, Doctors, Patients, Users
+
+# far ahead of any real booking, in the default partition if there is none for the month
+FIRST_SLOT = datetime(2099, 1, 5, 9, tzinfo=timezone.utc)
+SLOT = timedelta(minutes=30)
+
+
+class Command(BaseCommand):
+    help = (
+        "Books consultations through POST /api/consultations/ from concurrent clients in process and prints "
+        "created and rejected (409) bookings per second for every number of workers and share of conflicts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="client threads")
+        parser.add_argument(
+            "--attempts",
+            type=int,
+            nargs="+",
+            default=[1, 2, 5, 10],
+            help="bookings of every slot, all but one are conflicts: 1 - no conflicts, 10 - 90%% of them",
+        )
+        parser.add_argument("--doctors", type=int, default=20)
+        parser.add_argument("--slots", type=int, default=20, help="per doctor")
+
+    def handle(self, *args, workers, attempts, doctors, slots, **options):
+        admin, patient, clinic = self.create_fixtures()
+        created_doctors = []
+        try:
+            self.stdout.write(
+                f"{'workers':>7} {'conflicts':>9} {'requests':>8} {'created/s':>10} {'rejected/s':>10} "
+                f"{'total/s':>8} {'errors':>6}"
+            )
+            totals = []
+            for worker_count in workers:
+                for attempt_count in attempts:
+                    run_doctors = [self.create_doctor(clinic) for _ in range(doctors)]
+                    created_doctors += run_doctors
+                    jobs = [
+                        (doctor.pk, (FIRST_SLOT + SLOT * number).isoformat())
+                        for doctor in run_doctors
+                        for number in range(slots)
+                        for _ in range(attempt_count)
+                    ]
+                    random.shuffle(jobs)
+                    codes, elapsed = self.run(admin, patient, clinic, jobs, worker_count)
+                    created, rejected = codes.count(201), codes.count(409)
+                    totals.append(len(codes) / elapsed)
+                    self.stdout.write(
+                        f"{worker_count:>7} {1 - 1 / attempt_count:>9.0%} {len(codes):>8} "
+                        f"{created / elapsed:>10.1f} {rejected / elapsed:>10.1f} {totals[-1]:>8.1f} "
+                        f"{len(codes) - created - rejected:>6}"
+                    )
+            self.stdout.write(f"slowest run handled {min(totals) / max(totals):.0%} of the requests/s of the fastest")
+        finally:
+            # the consultations go with the doctors
+            Users.objects.filter(doctor__in=created_doctors).delete()
+            Users.objects.filter(pk__in=[admin.pk, patient.user_id]).delete()
+            clinic.delete()
+
+    def create_fixtures(self):
+        admin = Users.objects.create_user(username=f"bench.booking.{get_random_string(8)}", role="admin")
+        user = Users.objects.create_user(username=f"bench.booking.{get_random_string(8)}", role="patient")
+        clinic = Clinics.objects.create(name="Bench", legal_address="-", actual_address="-")
+        return admin, Patients.objects.create(user=user), clinic
+
+    def create_doctor(self, clinic):
+        user = Users.objects.create_user(username=f"bench.booking.{get_random_string(8)}", role="doctor")
+        doctor = Doctors.objects.create(user=user, specialization="Терапевт")
+        doctor.clinics.add(clinic)
+        return doctor
+
+    def run(self, admin, patient, clinic, jobs, worker_count):
+        codes = []
+
+        def book(worker_jobs):
+            client = APIClient()
+            client.force_authenticate(admin)
+            try:
+                for doctor, start_time in worker_jobs:
+                    data = {"doctor": doctor, "patient": patient.pk, "clinic": clinic.pk, "start_time": start_time}
+                    # list.append is atomic, the codes need no lock
+                    codes.append(client.post("/api/consultations/", data, format="json").status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(jobs[number::worker_count],)) for number in range(worker_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return codes, time.perf_counter() - started
@@ -0,0 +1,49 @@
+import statistics
+import time
+
+import psycopg
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from psycopg_pool import ConnectionPool
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the connection cost of a request with a new connection (connect, authenticate, query) "
+        "against a connection taken from a pool (checkout, query)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--iterations", type=int, default=500)
+
+    def handle(self, *args, database, iterations, **options):
+        params = connections[database].get_connection_params()
+
+        def connect():
+            with psycopg.connect(**params) as conn:
+                conn.execute("SELECT 1")
+
+        with ConnectionPool(kwargs=params, min_size=1, max_size=1) as pool:
+
+            def checkout():
+                with pool.connection() as conn:
+                    conn.execute("SELECT 1")
+
+            results = [("new connection", self.measure(connect, iterations))]
+            results.append(("pooled connection", self.measure(checkout, iterations)))
+
+        self.stdout.write(f"{'':<20} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, latencies in results:
+            p50, p99 = (statistics.quantiles(latencies, n=100)[i] for i in (49, 98))
+            self.stdout.write(f"{name:<20} {statistics.mean(latencies):>8.2f} {p50:>8.2f} {p99:>8.2f}")
+        saved = statistics.mean(results[0][1]) - statistics.mean(results[1][1])
+        self.stdout.write(self.style.SUCCESS(f"Pooling saves {saved:.2f} ms per request"))
+
+    def measure(self, func, iterations):
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            func()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
@@ -0,0 +1,72 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    "/api/consultations/",
+    "/api/consultations/?cursor=&limit=50",
+    "/api/consultations/?status__in=waiting,confirmed&ordering=start_time",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests the read endpoints of a running server and prints requests/sec and latency percentiles, "
+        "e.g. the WSGI deployment against the ASGI one with --async-prefix"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("base_url", help="e.g. http://127.0.0.1:8080")
+        parser.add_argument("--username", required=True)
+        parser.add_argument("--password", required=True)
+        parser.add_argument("--path", action="append", dest="paths", help=f"defaults to {', '.join(DEFAULT_PATHS)}")
+        parser.add_argument(
+            "--async-prefix", action="store_true", help="request /api/async/... instead of /api/..., see mis/urls.py"
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=2000, help="per path")
+
+    def handle(self, *args, base_url, username, password, paths, async_prefix, concurrency, requests, **options):
+        base_url = base_url.rstrip("/")
+        headers = {"Authorization": f"Bearer {self.get_token(base_url, username, password)}"}
+        self.stdout.write(f"{'path':<72} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for path in paths or DEFAULT_PATHS:
+            if async_prefix:
+                path = path.replace("/api/", "/api/async/", 1)
+            rps, latencies, errors = self.run(base_url + path, headers, concurrency, requests)
+            p50, p99 = (statistics.quantiles(latencies, n=100)[i] * 1000 for i in (49, 98))
+            self.stdout.write(f"{path:<72} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {errors:>7}")
+
+    def get_token(self, base_url, username, password):
+        body = json.dumps({"username": username, "password": password}).encode()
+        request = urllib.request.Request(
+            f"{base_url}/api/token/", data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.load(response)["access"]
+        except (urllib.error.URLError, KeyError) as e:
+            raise CommandError(f"Can't get a token: {e}")
+
+    def run(self, url, headers, concurrency, requests):
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, ConnectionError):
+                ok = False
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(fetch, range(requests)))
+        elapsed = time.perf_counter() - started
+        latencies = [latency for latency, ok in results if ok] or [0.0, 0.0]
+        return len(results) / elapsed, latencies, sum(not ok for latency, ok in results)
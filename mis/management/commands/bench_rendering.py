@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from mis.fast_serializers import ValuesSerializer
+from mis.models import Consultations
+from mis.renderers import FastJSONRenderer, orjson
+from mis.serializers import ConsultationsSerializer
+
+
+class Command(BaseCommand):
+    help = "Measures the JSON encode time of a consultations page with JSONRenderer against FastJSONRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100)
+        parser.add_argument("--iterations", type=int, default=1000)
+
+    def handle(self, *args, rows, iterations, **options):
+        if orjson is None:
+            self.stderr.write("orjson is not installed, FastJSONRenderer falls back to JSONRenderer")
+        values = ValuesSerializer.for_serializer(ConsultationsSerializer)
+        queryset = Consultations.objects.order_by("-start_time")[:rows]
+        pages = {
+            # what the list endpoint renders: datetimes are strings already
+            "serialized page": {"next": None, "results": values.to_representation(values.queryset(queryset))},
+            # datetime objects left to the renderer
+            "raw values": list(queryset.values()),
+        }
+
+        self.stdout.write(f"{'':<16} {'JSONRenderer us':>16} {'FastJSONRenderer us':>20} {'speedup':>8}")
+        for name, data in pages.items():
+            assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+            before = self.measure(JSONRenderer().render, data, iterations)
+            after = self.measure(FastJSONRenderer().render, data, iterations)
+            self.stdout.write(f"{name:<16} {before:>16.1f} {after:>20.1f} {before / after:>7.1f}x")
+
+    def measure(self, render, data, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            render(data)
+        return (time.perf_counter() - started) / iterations * 1_000_000
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mis.fast_serializers import ValuesSerializer
+from mis.views import ConsultationViewSet, DoctorsViewSet, PatientsViewSet
+
+VIEWSETS = {"consultations": ConsultationViewSet, "doctors": DoctorsViewSet, "patients": PatientsViewSet}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures rows per second of a list page built by the DRF serializer from model instances "
+        "against the .values() fast path, queries included"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--resource", choices=VIEWSETS, default="consultations")
+        parser.add_argument("--rows", type=int, nargs="+", default=[100, 10000])
+        parser.add_argument("--repeat", type=int, default=5, help="The best of this many runs is reported")
+
+    def handle(self, *args, resource, rows, repeat, **options):
+        view = VIEWSETS[resource](action="list")
+        queryset = view.get_queryset().order_by("-pk")
+        serializer_class = view.get_serializer_class()
+        values = ValuesSerializer.for_serializer(serializer_class)
+
+        self.stdout.write(f"{'rows':>6} {'':<14} {'serializer rows/s':>18} {'fast path rows/s':>17} {'speedup':>8}")
+        for count in rows:
+            page = queryset[:count]
+            instances, row_values = list(page), list(values.queryset(page))
+            runs = {
+                "with queries": (
+                    lambda: serializer_class(list(page.all()), many=True).data,
+                    lambda: values.to_representation(values.queryset(page)),
+                ),
+                "serializing": (
+                    lambda: serializer_class(instances, many=True).data,
+                    lambda: values.to_representation(row_values),
+                ),
+            }
+            for name, (serialize, fast_path) in runs.items():
+                before, after = self.measure(serialize, repeat), self.measure(fast_path, repeat)
+                count = len(instances)
+                self.stdout.write(
+                    f"{count:>6} {name:<14} {count / before:>18.0f} {count / after:>17.0f} {before / after:>7.1f}x"
+                )
+
+    def measure(self, func, repeat):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
@@ -0,0 +1,33 @@
+import json
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mis.importers import CHUNK_SIZE, FORMATS, import_consultations, read_records
+
+
+class Command(BaseCommand):
+    help = "Streams consultations from a CSV (with header) or NDJSON file into the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="file to import, '-' for stdin")
+        parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension, csv for stdin")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, path, format, chunk_size, **options):
+        fmt = format or ("ndjson" if Path(path).suffix in (".ndjson", ".jsonl") else "csv")
+        if path == "-":
+            result = import_consultations(read_records(sys.stdin, fmt), chunk_size)
+        else:
+            try:
+                with open(path, encoding="utf-8", newline="") as lines:
+                    result = import_consultations(read_records(lines, fmt), chunk_size)
+            except OSError as e:
+                raise CommandError(e)
+
+        for error in result.errors:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        if result.failed > len(result.errors):
+            self.stderr.write(f"... and {result.failed - len(result.errors)} more rejected rows")
+        self.stdout.write(self.style.SUCCESS(f"Created {result.created} consultations, rejected {result.failed}"))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mis.partitions import add_months, archive_partitions, ensure_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the monthly consultation partitions ahead of time and archives old partitions "
+        "where every consultation is paid"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, default=3, help="Months to create after the current one")
+        parser.add_argument(
+            "--archive-after",
+            type=int,
+            default=None,
+            help="Detach the paid partitions older than this many months and move them to the archive schema",
+        )
+
+    def handle(self, *args, **options):
+        this_month = month_start(timezone.now().date())
+        created = ensure_partitions(this_month, add_months(this_month, options["months_ahead"]))
+        for name in created:
+            self.stdout.write(f"Created {name}")
+
+        if options["archive_after"] is not None:
+            archived, kept = archive_partitions(add_months(this_month, -options["archive_after"]))
+            for name in archived:
+                self.stdout.write(f"Archived {name}")
+            for name in kept:
+                self.stdout.write(self.style.WARNING(f"Kept {name}, it has unpaid consultations"))
+
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} partitions"))
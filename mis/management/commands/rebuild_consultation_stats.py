@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mis.analytics import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the consultation counts per clinic, doctor, day and status behind /api/analytics/"
+
+    def handle(self, *args, **options):
+        rows = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} consultation stats rows"))
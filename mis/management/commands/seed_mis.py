@@ -0,0 +1,29 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mis import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads a deterministic synthetic dataset of clinics, doctors, patients and consultations with COPY "
+        f"in parallel processes, every user has the password {seeding.SEED_PASSWORD!r}"
+    )
+
+    def add_arguments(self, parser):
+        for table, count in seeding.DEFAULT_SIZES.items():
+            parser.add_argument(f"--{table}", type=int, default=count)
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--seed", type=int, default=0, help="the same seed gives the same data")
+
+    def handle(self, *args, clinics, doctors, patients, consultations, workers, seed, **options):
+        if seeding.is_seeded():
+            raise CommandError("The database is seeded already")
+        started = time.perf_counter()
+        created = seeding.seed(clinics, doctors, patients, consultations, seed_value=seed, workers=workers)
+        elapsed = time.perf_counter() - started
+        rows = sum(created.values())
+        self.stdout.write(", ".join(f"{count} {table}" for table, count in created.items()))
+        self.stdout.write(self.style.SUCCESS(f"Seeded {rows} rows in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)"))
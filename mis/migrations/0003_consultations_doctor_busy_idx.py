@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0002_consultations_created_at_alter_consultations_clinic_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['doctor', 'end_time', 'start_time'], name='consultation_doctor_busy_idx'),
+        ),
+    ]
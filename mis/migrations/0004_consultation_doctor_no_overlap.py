@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:44
+
+import django.contrib.postgres.constraints
+import mis.models
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0003_consultations_doctor_busy_idx'),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        # an open range would block the doctor forever, fill end_time the same way Consultations.save does
+        migrations.RunSQL(
+            "UPDATE mis_consultations SET end_time = start_time + interval '30 minutes' "
+            "WHERE end_time IS NULL OR end_time < start_time",
+            migrations.RunSQL.noop,
+        ),
+        migrations.RemoveIndex(
+            model_name='consultations',
+            name='consultation_doctor_busy_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='consultations',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[('doctor', '='), (mis.models.TsTzRange('start_time', 'end_time'), '&&')], name='consultation_doctor_no_overlap'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0004_consultation_doctor_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['-start_time', '-id'], name='consultation_start_time_id_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0005_consultation_start_time_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameCounters',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.CharField(max_length=150, unique=True, verbose_name='Основа логина')),
+                ('value', models.PositiveIntegerField(default=0, verbose_name='Последний суффикс')),
+            ],
+        ),
+        # continue numbering after the usernames generated before the counters existed
+        migrations.RunSQL(
+            """
+            INSERT INTO mis_usernamecounters (base, value)
+            SELECT base, max(value) FROM (
+                SELECT substring(username FROM '^(.+)_\\d{1,9}$') AS base,
+                       substring(username FROM '_(\\d{1,9})$')::integer AS value
+                FROM mis_users WHERE username ~ '^.+_\\d{1,9}$'
+                UNION ALL
+                SELECT username, 0 FROM mis_users WHERE username IS NOT NULL
+            ) usernames
+            GROUP BY base
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
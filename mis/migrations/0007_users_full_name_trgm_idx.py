@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:52
+
+import django.contrib.postgres.indexes
+import mis.models
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('mis', '0006_usernamecounters'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='users',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(mis.models.FullName(), name='gin_trgm_ops'), name='users_full_name_trgm_idx'),
+        ),
+    ]
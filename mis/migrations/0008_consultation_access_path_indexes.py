@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 14:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('mis', '0007_users_full_name_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='consultations',
+            name='doctor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='consultations', to='mis.doctors', verbose_name='Врач'),
+        ),
+        migrations.AlterField(
+            model_name='consultations',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='consultations', to='mis.patients', verbose_name='Пациент'),
+        ),
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['doctor', '-start_time'], name='consultation_doctor_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['patient', '-start_time'], name='consultation_patient_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['status', '-start_time'], name='consultation_status_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(condition=models.Q(('status__in', ('waiting', 'confirmed', 'started'))), fields=['-start_time'], name='consultation_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['-created_at'], name='consultation_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='users',
+            index=models.Index(fields=['last_name'], name='users_last_name_idx'),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0008_consultation_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('status', models.CharField(choices=[('waiting', 'Ожидает'), ('confirmed', 'Подтверждена'), ('started', 'Начата'), ('finished', 'Завершена'), ('paid', 'Оплачена')], max_length=30, verbose_name='Статус')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+                ('clinic', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='mis.clinics', verbose_name='Клиника')),
+                ('doctor', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='mis.doctors', verbose_name='Врач')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='consultation_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('clinic', 'doctor', 'day', 'status'), name='consultation_stats_key')],
+            },
+        ),
+        # statement level triggers see every write, including COPY imports, bulk status updates and cascades.
+        # Keys are upserted in a fixed order so concurrent writers can't deadlock, emptied rows are removed.
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION mis_consultation_stats_apply() RETURNS trigger LANGUAGE plpgsql AS $$
+            DECLARE
+                changes text;
+                emptied bigint[];
+            BEGIN
+                changes := CASE TG_OP
+                    WHEN 'INSERT' THEN 'SELECT clinic_id, doctor_id, start_time, status, 1 AS delta FROM new_rows'
+                    WHEN 'DELETE' THEN 'SELECT clinic_id, doctor_id, start_time, status, -1 AS delta FROM old_rows'
+                    ELSE 'SELECT clinic_id, doctor_id, start_time, status, -1 AS delta FROM old_rows
+                          UNION ALL SELECT clinic_id, doctor_id, start_time, status, 1 FROM new_rows'
+                END;
+                EXECUTE format($sql$
+                    WITH applied AS (
+                        INSERT INTO mis_consultationstats (clinic_id, doctor_id, day, status, count)
+                        SELECT clinic_id, doctor_id, (start_time AT TIME ZONE 'UTC')::date, status, sum(delta)
+                        FROM (%s) changes
+                        GROUP BY 1, 2, 3, 4
+                        HAVING sum(delta) <> 0
+                        ORDER BY 1, 2, 3, 4
+                        ON CONFLICT (clinic_id, doctor_id, day, status)
+                        DO UPDATE SET count = mis_consultationstats.count + EXCLUDED.count
+                        RETURNING id, count
+                    )
+                    SELECT array_agg(id) FROM applied WHERE count = 0
+                $sql$, changes) INTO emptied;
+                IF emptied IS NOT NULL THEN
+                    DELETE FROM mis_consultationstats WHERE id = ANY(emptied);
+                END IF;
+                RETURN NULL;
+            END
+            $$;
+
+            CREATE TRIGGER consultation_stats_insert AFTER INSERT ON mis_consultations
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+            CREATE TRIGGER consultation_stats_update AFTER UPDATE ON mis_consultations
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+            CREATE TRIGGER consultation_stats_delete AFTER DELETE ON mis_consultations
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+
+            INSERT INTO mis_consultationstats (clinic_id, doctor_id, day, status, count)
+            SELECT clinic_id, doctor_id, (start_time AT TIME ZONE 'UTC')::date, status, count(*)
+            FROM mis_consultations
+            GROUP BY 1, 2, 3, 4;
+            """,
+            """
+            DROP TRIGGER consultation_stats_insert ON mis_consultations;
+            DROP TRIGGER consultation_stats_update ON mis_consultations;
+            DROP TRIGGER consultation_stats_delete ON mis_consultations;
+            DROP FUNCTION mis_consultation_stats_apply();
+            """,
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0009_consultation_stats'),
+    ]
+
+    operations = [
+        # the composite index is created before the single column one is dropped
+        migrations.AddIndex(
+            model_name='consultations',
+            index=models.Index(fields=['clinic', 'start_time'], name='consultation_clinic_start_idx'),
+        ),
+        migrations.AlterField(
+            model_name='consultations',
+            name='clinic',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='consultations', to='mis.clinics', verbose_name='Клиника'),
+        ),
+    ]
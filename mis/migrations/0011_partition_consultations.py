@@ -0,0 +1,259 @@
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations
+from django.utils import timezone
+
+# frozen copies of the helpers of mis.partitions, as they were when the table was partitioned
+PARENT = "mis_consultations"
+DEFAULT_PARTITION = f"{PARENT}_default"
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    month_no = month.year * 12 + month.month - 1 + count
+    return date(month_no // 12, month_no % 12 + 1, 1)
+
+
+def _bound(month: date) -> str:
+    return datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc).isoformat()
+
+
+def _add_no_overlap(cursor, table):
+    cursor.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_no_overlap "
+        f"EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_time, end_time) WITH &&)"
+    )
+
+
+def create_default_partition(cursor):
+    cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT")
+    _add_no_overlap(cursor, DEFAULT_PARTITION)
+
+
+def create_partition(cursor, month: date):
+    name = f"{PARENT}_y{month:%Y}m{month:%m}"
+    start, end = _bound(month), _bound(add_months(month, 1))
+    cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= %s AND start_time < %s RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved",
+        [start, end],
+    )
+    _add_no_overlap(cursor, name)
+    cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+
+
+def create_partitions(apps, schema_editor):
+    # monthly partitions for every month with consultations and a few ahead, the rest stays in the default one
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT min(start_time) FROM mis_consultations_unpartitioned")
+        first = cursor.fetchone()[0]
+        this_month = month_start(timezone.now().date())
+        month, last = month_start(min(first.date(), this_month) if first else this_month), add_months(this_month, 3)
+
+        create_default_partition(cursor)
+        cursor.execute("INSERT INTO mis_consultations SELECT * FROM mis_consultations_unpartitioned")
+        while month <= last:
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+
+# back to one table with the constraints of 0010; the partitions moved to the archive schema stay there
+REVERSE_SQL = """
+CREATE TABLE mis_consultations_unpartitioned (
+    LIKE mis_consultations INCLUDING DEFAULTS INCLUDING IDENTITY
+);
+-- the new table has no triggers yet, the stats don't change
+INSERT INTO mis_consultations_unpartitioned SELECT * FROM mis_consultations;
+SELECT setval(
+    pg_get_serial_sequence('mis_consultations_unpartitioned', 'id'),
+    (SELECT coalesce(max(id), 0) + 1 FROM mis_consultations_unpartitioned),
+    false
+);
+
+DROP TABLE mis_consultations;
+DROP FUNCTION mis_consultation_no_overlap();
+DROP FUNCTION mis_consultation_overlaps_other_months(bigint, bigint, timestamptz, timestamptz);
+ALTER TABLE mis_consultations_unpartitioned RENAME TO mis_consultations;
+
+ALTER TABLE mis_consultations
+    ADD PRIMARY KEY (id),
+    ADD CONSTRAINT consultation_doctor_no_overlap
+        EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_time, end_time) WITH &&),
+    ADD CONSTRAINT mis_consultations_clinic_id_fk_mis_clinics_id
+        FOREIGN KEY (clinic_id) REFERENCES mis_clinics (id) DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT mis_consultations_doctor_id_fk_mis_doctors_id
+        FOREIGN KEY (doctor_id) REFERENCES mis_doctors (id) DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT mis_consultations_patient_id_fk_mis_patients_id
+        FOREIGN KEY (patient_id) REFERENCES mis_patients (id) DEFERRABLE INITIALLY DEFERRED;
+
+CREATE INDEX consultation_start_time_id_idx ON mis_consultations (start_time DESC, id DESC);
+CREATE INDEX consultation_doctor_start_idx ON mis_consultations (doctor_id, start_time DESC);
+CREATE INDEX consultation_patient_start_idx ON mis_consultations (patient_id, start_time DESC);
+CREATE INDEX consultation_clinic_start_idx ON mis_consultations (clinic_id, start_time);
+CREATE INDEX consultation_status_start_idx ON mis_consultations (status, start_time DESC);
+CREATE INDEX consultation_active_start_idx ON mis_consultations (start_time DESC)
+    WHERE status IN ('waiting', 'confirmed', 'started');
+CREATE INDEX consultation_created_at_idx ON mis_consultations (created_at DESC);
+
+CREATE TRIGGER consultation_stats_insert AFTER INSERT ON mis_consultations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+CREATE TRIGGER consultation_stats_update AFTER UPDATE ON mis_consultations
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+CREATE TRIGGER consultation_stats_delete AFTER DELETE ON mis_consultations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+
+ANALYZE mis_consultations;
+"""
+
+
+class Migration(migrations.Migration):
+    """
+    Converts mis_consultations to a table partitioned by start_time month.
+
+    The primary key and the overlap exclusion constraint can't be kept on the partitioned table as they are:
+    the key becomes (id, start_time) and every partition gets its own exclusion constraint, while the
+    consultation_no_overlap trigger checks a consultation against the ones of other months. Django's state
+    drops the constraint; the composite key isn't recorded, Django keeps using id, which is still unique
+    as it comes from one sequence. Reversible: the consultations are copied back into one table.
+    """
+
+    dependencies = [
+        ('mis', '0010_consultation_clinic_start_idx'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    """
+                    ALTER TABLE mis_consultations RENAME TO mis_consultations_unpartitioned;
+
+                    CREATE TABLE mis_consultations (
+                        LIKE mis_consultations_unpartitioned INCLUDING DEFAULTS INCLUDING IDENTITY,
+                        PRIMARY KEY (id, start_time)
+                    ) PARTITION BY RANGE (start_time);
+
+                    SELECT setval(
+                        pg_get_serial_sequence('mis_consultations', 'id'),
+                        (SELECT coalesce(max(id), 0) + 1 FROM mis_consultations_unpartitioned),
+                        false
+                    );
+                    """,
+                    # undone with the rest by the reverse of the last operation
+                    migrations.RunSQL.noop,
+                ),
+                migrations.RunPython(create_partitions, migrations.RunPython.noop),
+                # the stats are already up to date, the triggers follow the new table from here on
+                migrations.RunSQL(
+                    """
+                    DROP TABLE mis_consultations_unpartitioned;
+
+                    CREATE INDEX consultation_start_time_id_idx ON mis_consultations (start_time DESC, id DESC);
+                    CREATE INDEX consultation_doctor_start_idx ON mis_consultations (doctor_id, start_time DESC);
+                    CREATE INDEX consultation_patient_start_idx ON mis_consultations (patient_id, start_time DESC);
+                    CREATE INDEX consultation_clinic_start_idx ON mis_consultations (clinic_id, start_time);
+                    CREATE INDEX consultation_status_start_idx ON mis_consultations (status, start_time DESC);
+                    CREATE INDEX consultation_active_start_idx ON mis_consultations (start_time DESC)
+                        WHERE status IN ('waiting', 'confirmed', 'started');
+                    CREATE INDEX consultation_created_at_idx ON mis_consultations (created_at DESC);
+
+                    -- foreign keys are added after the copy, they are checked in one go and queue no trigger events
+                    ALTER TABLE mis_consultations
+                        ADD CONSTRAINT mis_consultations_clinic_id_fk_mis_clinics_id
+                            FOREIGN KEY (clinic_id) REFERENCES mis_clinics (id) DEFERRABLE INITIALLY DEFERRED,
+                        ADD CONSTRAINT mis_consultations_doctor_id_fk_mis_doctors_id
+                            FOREIGN KEY (doctor_id) REFERENCES mis_doctors (id) DEFERRABLE INITIALLY DEFERRED,
+                        ADD CONSTRAINT mis_consultations_patient_id_fk_mis_patients_id
+                            FOREIGN KEY (patient_id) REFERENCES mis_patients (id) DEFERRABLE INITIALLY DEFERRED;
+
+                    CREATE TRIGGER consultation_stats_insert AFTER INSERT ON mis_consultations
+                        REFERENCING NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+                    CREATE TRIGGER consultation_stats_update AFTER UPDATE ON mis_consultations
+                        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+                    CREATE TRIGGER consultation_stats_delete AFTER DELETE ON mis_consultations
+                        REFERENCING OLD TABLE AS old_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION mis_consultation_stats_apply();
+
+                    -- the overlap constraints of the partitions only compare consultations of one month,
+                    -- the ones of a doctor in other months are checked here; volatile, so the queries see
+                    -- what has been committed while the trigger waited for the lock
+                    CREATE FUNCTION mis_consultation_overlaps_other_months(
+                        consultation_id bigint, doctor bigint, starts timestamptz, ends timestamptz
+                    ) RETURNS boolean LANGUAGE plpgsql VOLATILE AS $$
+                    DECLARE
+                        month_start timestamptz := date_trunc('month', starts AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+                        latest record;
+                    BEGIN
+                        -- no two consultations of a doctor overlap, so the last one to start earlier also ends last;
+                        -- it's looked for in the last two months first, they are enough unless the doctor had a break
+                        SELECT start_time, end_time INTO latest FROM mis_consultations
+                        WHERE doctor_id = doctor AND id IS DISTINCT FROM consultation_id
+                            AND start_time < starts AND start_time >= month_start - interval '1 month'
+                        ORDER BY start_time DESC LIMIT 1;
+                        IF NOT FOUND THEN
+                            SELECT start_time, end_time INTO latest FROM mis_consultations
+                            WHERE doctor_id = doctor AND start_time < starts AND id IS DISTINCT FROM consultation_id
+                            ORDER BY start_time DESC LIMIT 1;
+                        END IF;
+                        IF latest.start_time < month_start AND coalesce(latest.end_time, 'infinity') > starts THEN
+                            RETURN true;
+                        END IF;
+                        RETURN EXISTS (
+                            SELECT 1 FROM mis_consultations
+                            WHERE doctor_id = doctor AND id IS DISTINCT FROM consultation_id
+                                AND start_time >= month_start + interval '1 month'
+                                AND start_time < coalesce(ends, 'infinity')
+                        );
+                    END
+                    $$;
+
+                    CREATE FUNCTION mis_consultation_no_overlap() RETURNS trigger LANGUAGE plpgsql AS $$
+                    BEGIN
+                        -- a consultation running into the next month takes the lock of its doctor (one of 128
+                        -- shared by remainder) exclusively and the rest share it, so overlapping writes in two
+                        -- months see each other
+                        IF NEW.end_time IS NULL OR NEW.end_time > (
+                            date_trunc('month', NEW.start_time AT TIME ZONE 'UTC') + interval '1 month'
+                        ) AT TIME ZONE 'UTC' THEN
+                            PERFORM pg_advisory_xact_lock(
+                                hashtext('mis_consultations'), (NEW.doctor_id % 128)::integer
+                            );
+                        ELSE
+                            PERFORM pg_advisory_xact_lock_shared(
+                                hashtext('mis_consultations'), (NEW.doctor_id % 128)::integer
+                            );
+                        END IF;
+                        IF mis_consultation_overlaps_other_months(
+                            NEW.id, NEW.doctor_id, NEW.start_time, NEW.end_time
+                        ) THEN
+                            RAISE EXCEPTION 'consultation % of doctor % overlaps another one', NEW.id, NEW.doctor_id
+                                USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'consultation_doctor_no_overlap';
+                        END IF;
+                        RETURN NEW;
+                    END
+                    $$;
+
+                    CREATE TRIGGER consultation_no_overlap BEFORE INSERT OR UPDATE OF doctor_id, start_time, end_time
+                        ON mis_consultations FOR EACH ROW EXECUTE FUNCTION mis_consultation_no_overlap();
+
+                    ANALYZE mis_consultations;
+                    """,
+                    REVERSE_SQL,
+                ),
+            ],
+            # the exclusion constraint is on every partition and in the trigger now, which Django can't describe;
+            # id stays the primary key for Django, it's still taken from one sequence
+            state_operations=[
+                migrations.RemoveConstraint(model_name='consultations', name='consultation_doctor_no_overlap'),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0011_partition_consultations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='auth_version',
+            field=models.CharField(default='', editable=False, max_length=32, verbose_name='Версия авторизации'),
+        ),
+    ]
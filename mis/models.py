@@ -1,9 +1,29 @@
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 
+class TsTzRange(models.Func):
+    function = "TSTZRANGE"
+    output_field = DateTimeRangeField()
+
+
+class FullName(models.Func):
+    # `||` instead of CONCAT(), which is not immutable and can't be indexed
+    template = "(%(expressions)s)"
+    arg_joiner = " || ' ' || "
+    output_field = models.TextField()
+
+    def __init__(self, prefix=""):
+        names = ("last_name", "first_name", "middle_name")
+        super().__init__(*(Coalesce(f"{prefix}{name}", models.Value("")) for name in names))
+
+
 class Clinics(models.Model):
     name = models.CharField("Название", max_length=100)
     legal_address = models.TextField("юридический адрес")
@@ -26,6 +46,14 @@ class Users(AbstractUser):
     middle_name = models.CharField("Отчество", max_length=100, blank=True, null=True)
     email = models.EmailField("email", blank=True)
     username = models.CharField("Логин (не обязательно)", max_length=150, unique=True, null=True, blank=True)
+    # changed with the role, is_staff or is_active, the tokens issued before carry the old one
+    auth_version = models.CharField("Версия авторизации", max_length=32, default="", editable=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            GinIndex(OpClass(FullName(), name="gin_trgm_ops"), name="users_full_name_trgm_idx"),
+            models.Index(fields=["last_name"], name="users_last_name_idx"),
+        ]
 
     def __str__(self):
         if self.middle_name:
@@ -34,6 +62,16 @@ class Users(AbstractUser):
             return f"{self.first_name} {self.last_name} ({self.role})"
 
 
+class UsernameCounters(models.Model):
+    """Last suffix handed out for a generated username base, see `serializers._generate_username`."""
+
+    base = models.CharField("Основа логина", max_length=150, unique=True)
+    value = models.PositiveIntegerField("Последний суффикс", default=0)
+
+    def __str__(self):
+        return f"{self.base}: {self.value}"
+
+
 class Doctors(models.Model):
     user = models.OneToOneField(
         Users,
@@ -62,6 +100,10 @@ class Patients(models.Model):
         return str(self.user)
 
 
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ACTIVE_CONSULTATION_STATUSES = ("waiting", "confirmed", "started")
+
+
 class Consultations(models.Model):
     STATUS_CHOICES = (
         ("waiting", "Ожидает"),
@@ -71,11 +113,16 @@ class Consultations(models.Model):
         ("paid", "Оплачена"),
     )
 
-    doctor = models.ForeignKey(Doctors, on_delete=models.CASCADE, related_name="consultations", verbose_name="Врач")
+    # doctor, patient and clinic are the leading columns of the (doctor|patient|clinic, start_time) indexes below
+    doctor = models.ForeignKey(
+        Doctors, on_delete=models.CASCADE, related_name="consultations", verbose_name="Врач", db_index=False
+    )
     patient = models.ForeignKey(
-        Patients, on_delete=models.CASCADE, related_name="consultations", verbose_name="Пациент"
+        Patients, on_delete=models.CASCADE, related_name="consultations", verbose_name="Пациент", db_index=False
+    )
+    clinic = models.ForeignKey(
+        Clinics, on_delete=models.CASCADE, related_name="consultations", verbose_name="Клиника", db_index=False
     )
-    clinic = models.ForeignKey(Clinics, on_delete=models.CASCADE, related_name="consultations", verbose_name="Клиника")
 
     start_time = models.DateTimeField("Дата и время консультации", blank=False, null=False)
     end_time = models.DateTimeField("Время окончания консультации", blank=True, null=True)
@@ -84,13 +131,103 @@ class Consultations(models.Model):
     updated_at = models.DateTimeField("Последнее редактирование", auto_now=True)
     notes = models.TextField("Заметки", blank=True, null=True)
 
+    DEFAULT_DURATION = timedelta(minutes=30)
+    # status -> the statuses it may be reached from: waiting -> confirmed -> started -> finished -> paid
+    STATUS_TRANSITIONS = {
+        "confirmed": ("waiting",),
+        "started": ("confirmed",),
+        "finished": ("started",),
+        "paid": ("finished",),
+    }
+
     class Meta:
         ordering = ["-start_time"]
+        indexes = [
+            # keyset pagination by the default ordering with id as a tiebreaker
+            models.Index(fields=["-start_time", "-id"], name="consultation_start_time_id_idx"),
+            models.Index(fields=["doctor", "-start_time"], name="consultation_doctor_start_idx"),
+            models.Index(fields=["patient", "-start_time"], name="consultation_patient_start_idx"),
+            models.Index(fields=["clinic", "start_time"], name="consultation_clinic_start_idx"),
+            models.Index(fields=["status", "-start_time"], name="consultation_status_start_idx"),
+            models.Index(
+                fields=["-start_time"],
+                condition=models.Q(status__in=ACTIVE_CONSULTATION_STATUSES),
+                name="consultation_active_start_idx",
+            ),
+            models.Index(fields=["-created_at"], name="consultation_created_at_idx"),
+        ]
+        # a doctor can't have two consultations at the same time; [start_time, end_time) ranges may only touch.
+        # The table is partitioned by start_time month (see mis.partitions), so it's no constraint Django can
+        # describe: every partition has an exclusion constraint, whose GiST index also serves range lookups
+        # of a doctor's busy intervals, and the consultation_no_overlap trigger compares consultations across
+        # months (migration 0011).
+
+    @classmethod
+    def default_end_time(cls, start_time, end_time):
+        if start_time and not end_time or end_time < start_time:
+            return start_time + cls.DEFAULT_DURATION
+        return end_time
 
     def save(self, *args, **kwargs):
-        if self.start_time and not self.end_time or self.end_time < self.start_time:
-            self.end_time = self.start_time + timedelta(minutes=30)
+        self.end_time = self.default_end_time(self.start_time, self.end_time)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def etag_for(updated_at):
+        # microseconds since the epoch, exact unlike a float timestamp
+        return f'"{(updated_at - EPOCH) // timedelta(microseconds=1)}"'
+
+    @property
+    def etag(self):
+        return self.etag_for(self.updated_at)
+
+    def save_if_unmodified(self, updated_at) -> bool:
+        """
+        Writes the instance with a conditional UPDATE, only if the row still has `updated_at`.
+
+        Returns False if somebody has saved the consultation in between, without row locks.
+        """
+        self.end_time = self.default_end_time(self.start_time, self.end_time)
+        self.updated_at = timezone.now()
+        fields = [field for field in self._meta.concrete_fields if not field.primary_key]
+        values = {field.attname: getattr(self, field.attname) for field in fields}
+        return bool(type(self)._base_manager.filter(pk=self.pk, updated_at=updated_at).update(**values))
+
     def __str__(self):
         return f"Консультация {self.start_time.strftime('%Y-%m-%d %H:%M')}.{self.doctor} => {self.patient}"
+
+
+class ConsultationStats(models.Model):
+    """
+    Number of consultations per clinic, doctor, day (UTC) and status.
+
+    Maintained by triggers on the consultations table (migration 0009), so every write path is counted,
+    including raw SQL and cascades. `manage.py rebuild_consultation_stats` recomputes it from scratch.
+    """
+
+    # no FK constraints: the rows of a deleted doctor or clinic go away with its consultations
+    clinic = models.ForeignKey(
+        Clinics,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name="+",
+        verbose_name="Клиника",
+    )
+    doctor = models.ForeignKey(
+        Doctors, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+", verbose_name="Врач"
+    )
+    day = models.DateField("День")
+    status = models.CharField(choices=Consultations.STATUS_CHOICES, max_length=30, verbose_name="Статус")
+    count = models.IntegerField("Количество", default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["clinic", "doctor", "day", "status"], name="consultation_stats_key"),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="consultation_stats_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.clinic_id}/{self.doctor_id} {self.status}: {self.count}"
@@ -0,0 +1,114 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetOrLimitOffsetPagination(LimitOffsetPagination):
+    """
+    LimitOffset by default, keyset pagination when the `cursor` parameter is present (`?cursor=` for the first page).
+
+    The keyset follows the first ordering field of the queryset with `id` as a tiebreaker, so every page is
+    an index range scan from the previous position and no COUNT(*) is issued.
+    """
+
+    cursor_query_param = "cursor"
+    tiebreaker = "id"
+    invalid_cursor_message = "Invalid cursor"
+    known_count = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            self.known_count = getattr(view, "list_count", None)
+            return super().paginate_queryset(queryset, request, view)
+
+        queryset = self.keyset_queryset(queryset, request)
+        return self.keyset_page(list(queryset[: self.limit + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """`paginate_queryset` on the async ORM."""
+        self.keyset = self.cursor_query_param in request.query_params
+        if self.keyset:
+            queryset = self.keyset_queryset(queryset, request)
+            return self.keyset_page([obj async for obj in queryset[: self.limit + 1]])
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.count = getattr(view, "list_count", None)
+        if self.count is None:
+            self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [obj async for obj in queryset[self.offset: self.offset + self.limit]]
+
+    def get_count(self, queryset):
+        if self.known_count is not None:
+            return self.known_count
+        return super().get_count(queryset)
+
+    def keyset_queryset(self, queryset, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        field = (queryset.query.order_by or queryset.model._meta.ordering)[0]
+        self.field, self.descending = field.lstrip("-"), field.startswith("-")
+        sign = "-" if self.descending else ""
+        queryset = queryset.order_by(f"{sign}{self.field}", f"{sign}{self.tiebreaker}")
+
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            value, pk = position
+            before, after = ("lt", "lte") if self.descending else ("gt", "gte")
+            # `field <= v AND (field < v OR id < pk)` keeps an index range condition on the leading column
+            queryset = queryset.filter(
+                Q(**{f"{self.field}__{after}": value}),
+                Q(**{f"{self.field}__{before}": value}) | Q(**{f"{self.tiebreaker}__{before}": pk}),
+            )
+        return queryset
+
+    def keyset_page(self, results):
+        self.has_next = len(results) > self.limit
+        self.page = results[: self.limit]
+        return self.page
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params[self.cursor_query_param]
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return model._meta.get_field(self.field).to_python(value), int(pk)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance):
+        # a model instance or a row of .values() from the list fast path
+        if isinstance(instance, dict):
+            value, pk = instance[self.field], instance[self.tiebreaker]
+        else:
+            value, pk = getattr(instance, self.field), instance.pk
+        position = [value.isoformat() if hasattr(value, "isoformat") else value, pk]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({"next": self.get_next_link(), "results": data})
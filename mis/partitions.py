@@ -0,0 +1,120 @@
+from datetime import date, datetime, timezone
+
+from django.db import connection, transaction
+
+from mis.models import Consultations
+
+PARENT = Consultations._meta.db_table
+DEFAULT_PARTITION = f"{PARENT}_default"
+ARCHIVE_SCHEMA = "archive"
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    month_no = month.year * 12 + month.month - 1 + count
+    return date(month_no // 12, month_no % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_y{month:%Y}m{month:%m}"
+
+
+def _bound(month: date) -> str:
+    # partitions are cut at UTC midnights, like the days of ConsultationStats
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc).isoformat()
+
+
+def _add_no_overlap(cursor, table):
+    # an exclusion constraint on the partitioned table would have to compare start_time with "=", so every partition
+    # gets its own; consultations running into the next month are checked by the consultation_no_overlap trigger
+    cursor.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_no_overlap "
+        f"EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_time, end_time) WITH &&)"
+    )
+
+
+def monthly_partitions(cursor) -> dict[date, str]:
+    """Returns the monthly partitions of the consultations by month, the default partition is left out."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = %s::regclass",
+        [PARENT],
+    )
+    prefix = f"{PARENT}_y"
+    return {
+        date(int(name[len(prefix):len(prefix) + 4]), int(name[-2:]), 1): name
+        for name, in cursor.fetchall()
+        if name.startswith(prefix)
+    }
+
+
+def create_default_partition(cursor):
+    cursor.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT")
+    _add_no_overlap(cursor, DEFAULT_PARTITION)
+
+
+def create_partition(cursor, month: date) -> str:
+    """
+    Creates the partition of `month` and moves the consultations of that month out of the default partition.
+
+    The rows are moved partition to partition, so the statement triggers of the parent table don't see them
+    and ConsultationStats stays as it is.
+    """
+    name = partition_name(month)
+    start, end = _bound(month), _bound(add_months(month, 1))
+    cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= %s AND start_time < %s RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved",
+        [start, end],
+    )
+    _add_no_overlap(cursor, name)
+    # attaching creates the indexes of the parent table and checks the default partition has no rows of the month
+    cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+    return name
+
+
+def ensure_partitions(first: date, last: date) -> list[str]:
+    """Creates the missing monthly partitions from `first` to `last` month inclusive, returns their names."""
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = monthly_partitions(cursor)
+        month = month_start(first)
+        while month <= last:
+            if month not in existing:
+                created.append(create_partition(cursor, month))
+            month = add_months(month, 1)
+    return created
+
+
+def archive_partitions(before: date) -> tuple[list[str], list[str]]:
+    """
+    Detaches the monthly partitions older than `before` month where every consultation is paid,
+    and moves them to the archive schema.
+
+    Returns the archived partitions and the ones kept because of unpaid consultations. The detached rows stay
+    counted in ConsultationStats.
+    """
+    archived, kept = [], []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        old = [month for month in monthly_partitions(cursor) if month < month_start(before)]
+        if old:
+            # writers lock the parent table before a partition, and the detach needs the parent exclusively:
+            # taken in the same order up front, the lock can't be waited for while a partition is held
+            cursor.execute(f"LOCK TABLE ONLY {PARENT} IN ACCESS EXCLUSIVE MODE")
+        for month, name in sorted(monthly_partitions(cursor).items()):
+            if month >= month_start(before):
+                continue
+            # nothing can change a status between the check and the detach, not even through the partition
+            cursor.execute(f"LOCK TABLE {name} IN SHARE MODE")
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE status <> 'paid')")
+            if cursor.fetchone()[0]:
+                kept.append(name)
+                continue
+            cursor.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+            cursor.execute(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}")
+            archived.append(f"{ARCHIVE_SCHEMA}.{name}")
+    return archived, kept
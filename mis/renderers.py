@@ -0,0 +1,56 @@
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # the stdlib json of the DRF classes is used
+    orjson = None
+
+LINE_SEPARATOR, PARAGRAPH_SEPARATOR = "\u2028".encode(), "\u2029".encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    `JSONRenderer` on orjson: datetimes, dates, UUIDs and dicts are encoded natively, anything else
+    (Decimal, timedelta, lazy strings, ...) goes through the DRF encoder, so the output stays the same.
+
+    Indented output (the browsable API, `; indent=` in Accept) and a missing orjson fall back to `JSONRenderer`.
+    """
+
+    options = orjson.OPT_UTC_Z if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or self.ensure_ascii or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        default = self.encoder_class().default
+        try:
+            ret = orjson.dumps(data, default=default, option=self.options)
+        except orjson.JSONEncodeError:
+            # keys other than strings, the option takes orjson off its fast path so it is only used when needed
+            ret = orjson.dumps(data, default=default, option=self.options | orjson.OPT_NON_STR_KEYS)
+        # escaped like JSONRenderer does, for a strict JavaScript subset; both start with a byte that is rare in UTF-8
+        if LINE_SEPARATOR[:1] in ret:
+            ret = ret.replace(LINE_SEPARATOR, b"\\u2028").replace(PARAGRAPH_SEPARATOR, b"\\u2029")
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """`JSONParser` on orjson, a request in another encoding than UTF-8 falls back to the stdlib."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("_", "-") not in ("utf-8", "utf8") or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA_DB_ALIAS = "replica"
+
+
+class _ReplicaReads:
+    allowed = False
+
+
+_replica_reads = ContextVar("replica_reads", default=None)
+
+
+def _written_key(user_id):
+    return f"db:written:{user_id}"
+
+
+@contextmanager
+def replica_reads(method):
+    """Scope of a request whose reads may go to the replica, once `allow_replica_reads` is called."""
+    reads = None
+    if REPLICA_DB_ALIAS in settings.DATABASES and method in SAFE_METHODS:
+        reads = _ReplicaReads()
+    token = _replica_reads.set(reads)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def allow_replica_reads(user):
+    """Switches the reads to the replica, unless the user has written within `REPLICA_STICKY_SECONDS`."""
+    reads = _replica_reads.get()
+    if reads is not None:
+        reads.allowed = not (user.is_authenticated and cache.get(_written_key(user.pk)))
+
+
+def mark_written(user):
+    """Keeps the next reads of the user on the primary until the replica has caught up with the write."""
+    if REPLICA_DB_ALIAS in settings.DATABASES and user.is_authenticated:
+        cache.set(_written_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads allowed by `allow_replica_reads` to the `replica` database, everything else to the primary.
+
+    The aliases are returned explicitly, otherwise Django would save an object to the database it was read from.
+    """
+
+    def db_for_read(self, model, **hints):
+        reads = _replica_reads.get()
+        if reads is not None and reads.allowed:
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        reads = _replica_reads.get()
+        if reads is not None:
+            # read-after-write within the request
+            reads.allowed = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaReadsMixin:
+    """
+    Serves the safe requests of a viewset from the replica, see `ReplicaRouter`.
+
+    Authentication still reads from the primary, a successful write keeps the user on the primary for a while.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request.method):
+            response = super().dispatch(request, *args, **kwargs)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            mark_written(self.request.user)
+        return response
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        allow_replica_reads(request.user)
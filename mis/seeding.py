@@ -0,0 +1,216 @@
+import math
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta, timezone
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from mis.models import Clinics, Consultations, Doctors, Patients, Users
+from mis.partitions import ensure_partitions, month_start
+
+SEED_PASSWORD = "seed-password"
+USERNAME_PREFIX = "seed."
+# rows per COPY and per transaction; every chunk has its own random generator, so the rows do not depend
+# on the number of workers
+CHUNK_SIZE = 50_000
+DEFAULT_SIZES = {"clinics": 50, "doctors": 5000, "patients": 1_000_000, "consultations": 10_000_000}
+
+LAST_NAMES = (
+    "Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Васильев", "Соколов", "Михайлов", "Новиков",
+    "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов",
+)
+FIRST_NAMES = ("Александр", "Мария", "Дмитрий", "Анна", "Сергей", "Елена", "Андрей", "Ольга", "Алексей", "Наталья")
+MIDDLE_NAMES = ("Александрович", "Сергеевна", "Дмитриевич", "Андреевна", "Игоревич", "Викторовна")
+SPECIALIZATIONS = ("Терапевт", "Хирург", "Кардиолог", "Невролог", "Педиатр", "Офтальмолог", "Стоматолог", "Лор")
+
+# a working day of a doctor: half hour consultations from 09:00 UTC, never across midnight or a month boundary
+DAY_START = time(9, tzinfo=timezone.utc)
+SLOT = timedelta(minutes=30)
+SLOTS_PER_DAY = 16
+# the part of every doctor's schedule that is still ahead of `today`
+FUTURE_SHARE = 0.1
+
+USER_COLUMNS = (
+    "id", "password", "is_superuser", "username", "first_name", "last_name", "middle_name", "email", "is_staff",
+    "is_active", "date_joined", "role", "auth_version",
+)
+CONSULTATION_COLUMNS = (
+    "doctor_id", "patient_id", "clinic_id", "start_time", "end_time", "status", "created_at", "updated_at",
+)
+
+
+def is_seeded() -> bool:
+    return Users.objects.filter(username__startswith=USERNAME_PREFIX).exists()
+
+
+def reserve_ids(model, count: int) -> int:
+    """
+    Takes `count` ids of `model` from its sequence at once and returns the first one.
+
+    nextval() and setval() are two calls: the table is locked against inserts in between, so no other session
+    takes an id inside the range.
+    """
+    if not count:
+        return 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {model._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT setval(seq, nextval(seq) + %(count)s - 1) - %(count)s + 1 "
+            "FROM pg_get_serial_sequence(%(table)s, 'id') seq",
+            {"count": count, "table": model._meta.db_table},
+        )
+        return cursor.fetchone()[0]
+
+
+def copy_rows(table, columns, rows) -> int:
+    """Loads `rows` into `table` with one COPY in a transaction of its own, returns their number."""
+    count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+                count += 1
+    return count
+
+
+def _rng(plan, name, start):
+    return random.Random(f"{plan['seed']}:{name}:{start}")
+
+
+def _clinic(number):
+    return Clinics(
+        name=f"Клиника {number}", legal_address=f"ул. Ленина, {number}", actual_address=f"ул. Мира, {number}"
+    )
+
+
+def _users(role):
+    def rows(plan, start, stop):
+        rng = _rng(plan, f"{role}_users", start)
+        first_id = plan[f"{role}_users"]
+        for number in range(start, stop):
+            yield (
+                first_id + number, plan["password"], False, f"{USERNAME_PREFIX}{role}.{number}",
+                rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), rng.choice(MIDDLE_NAMES),
+                f"{role}.{number}@example.com", False, True, plan["joined"], role, "",
+            )
+
+    return rows
+
+
+def _doctors(plan, start, stop):
+    rng = _rng(plan, "doctors", start)
+    for number in range(start, stop):
+        yield plan["doctors"] + number, plan["doctor_users"] + number, rng.choice(SPECIALIZATIONS), f"+7900{number:07}"
+
+
+def _patients(plan, start, stop):
+    for number in range(start, stop):
+        yield plan["patients"] + number, plan["patient_users"] + number, f"+7901{number:07}"
+
+
+def _consultations(plan, start, stop):
+    rng = _rng(plan, "consultations", start)
+    doctor_clinics, statuses = plan["doctor_clinics"], [status for status, _ in Consultations.STATUS_CHOICES]
+    for number in range(start, stop):
+        # doctors fill a day slot by slot before the next day starts
+        slot, index = divmod(number, len(doctor_clinics))
+        day = plan["first_day"] + timedelta(days=slot // SLOTS_PER_DAY)
+        start_time = datetime.combine(day, DAY_START) + SLOT * (slot % SLOTS_PER_DAY)
+        if day < plan["today"]:
+            status = rng.choices(statuses, weights=(1, 1, 1, 10, 87))[0]
+        else:
+            status = rng.choice(statuses[:2])
+        created_at = start_time - timedelta(days=rng.randint(1, 30))
+        yield (
+            plan["doctors"] + index, plan["patients"] + rng.randrange(plan["patient_count"]),
+            rng.choice(doctor_clinics[index]), start_time, start_time + SLOT, status, created_at,
+            start_time if day < plan["today"] else created_at,
+        )
+
+
+# the parts loaded in chunks: table, columns, rows(plan, start, stop)
+LOADERS = {
+    "doctor_users": (Users._meta.db_table, USER_COLUMNS, _users("doctor")),
+    "patient_users": (Users._meta.db_table, USER_COLUMNS, _users("patient")),
+    "doctors": (Doctors._meta.db_table, ("id", "user_id", "specialization", "phone"), _doctors),
+    "patients": (Patients._meta.db_table, ("id", "user_id", "phone"), _patients),
+    "consultations": (Consultations._meta.db_table, CONSULTATION_COLUMNS, _consultations),
+}
+
+
+def _load_chunk(name, plan, start, stop):
+    table, columns, rows = LOADERS[name]
+    return copy_rows(table, columns, rows(plan, start, stop))
+
+
+def _load(executor, name, plan, count):
+    starts = range(0, count, CHUNK_SIZE)
+    stops = [min(start + CHUNK_SIZE, count) for start in starts]
+    run = map if executor is None else executor.map
+    return sum(run(_load_chunk, [name] * len(starts), [plan] * len(starts), starts, stops))
+
+
+def seed(clinics: int, doctors: int, patients: int, consultations: int, today=None, seed_value=0, workers=1):
+    """
+    Loads a deterministic dataset with COPY and returns the number of created rows per table.
+
+    The same arguments give the same rows whatever `workers` is, dates are relative to `today` (UTC).
+    Ids are reserved from the sequences up front, so every table is loaded in chunks by `workers` processes,
+    users before doctors and patients, they before consultations. Every user has the password `SEED_PASSWORD`
+    hashed once. Consultations are spread over the doctors' working days without overlaps, the past ones
+    mostly paid, the upcoming ones waiting or confirmed.
+    """
+    rng = random.Random(seed_value)
+    today = today or datetime.now(timezone.utc).date()
+    clinic_ids = [clinic.pk for clinic in Clinics.objects.bulk_create(_clinic(number) for number in range(clinics))]
+    if not clinic_ids:
+        doctors = 0
+    if not (doctors and patients):
+        consultations = 0
+    doctor_clinics = [rng.sample(clinic_ids, min(len(clinic_ids), rng.randint(1, 3))) for _ in range(doctors)]
+    days = -(-consultations // (doctors * SLOTS_PER_DAY)) if consultations else 0
+    plan = {
+        "seed": seed_value,
+        "password": make_password(SEED_PASSWORD, salt="seed"),
+        "joined": datetime.combine(today, time(), timezone.utc),
+        "today": today,
+        "first_day": today - timedelta(days=days - math.ceil(days * FUTURE_SHARE)),
+        "doctor_users": reserve_ids(Users, doctors + patients),
+        "doctors": reserve_ids(Doctors, doctors),
+        "patients": reserve_ids(Patients, patients),
+        "patient_count": patients,
+        "doctor_clinics": doctor_clinics,
+    }
+    plan["patient_users"] = plan["doctor_users"] + doctors
+    if consultations:
+        ensure_partitions(month_start(plan["first_day"]), month_start(plan["first_day"] + timedelta(days=days)))
+
+    executor = None
+    if workers > 1:
+        # spawned: forked workers would share the connections (and the pool) of this process; Django is set up
+        # before the tasks, which import the models
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup)
+    try:
+        # every part is committed before the next one, whose foreign keys point to it
+        _load(executor, "doctor_users", plan, doctors)
+        _load(executor, "patient_users", plan, patients)
+        created = {"clinics": len(clinic_ids), "doctors": _load(executor, "doctors", plan, doctors)}
+        copy_rows(
+            Doctors.clinics.through._meta.db_table,
+            ("doctors_id", "clinics_id"),
+            ((plan["doctors"] + index, clinic) for index, ids in enumerate(doctor_clinics) for clinic in ids),
+        )
+        created["patients"] = _load(executor, "patients", plan, patients)
+        created["consultations"] = _load(executor, "consultations", plan, consultations)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    with connection.cursor() as cursor:
+        for model in (Users, Doctors, Patients, Consultations):
+            cursor.execute(f"ANALYZE {model._meta.db_table}")
+    return created
@@ -1,21 +1,63 @@
-from rest_framework import serializers
-from mis.models import Consultations, Doctors, Patients, Clinics, Users
+from datetime import timedelta
+from functools import partial
 
+from django.db import IntegrityError, connection, transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from mis.models import Consultations, Doctors, Patients, Clinics, Users, UsernameCounters
+from mis.sparse import SparseFieldsMixin
+
+
+EXCLUSION_VIOLATION = "23P01"
+
+
+class ConsultationOverlap(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The doctor already has a consultation at this time."
+    default_code = "consultation_overlap"
 
-def _ensure_username_or_generate(fields: dict):
-    if fields.get("username"):
-        return
 
-    base = f"{fields.get("last_name")}_{fields.get("first_name")[0]}{fields.get("middle_name")[0]}"
-    username = base
-    counter = 1
-    while Users.objects.filter(username=username).exists():
-        username = f"{base}_{counter}"
-        counter += 1
-    fields["username"] = username
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The consultation has been modified, fetch it again."
+    default_code = "precondition_failed"
 
 
-class ClinicSerializer(serializers.ModelSerializer):
+USERNAME_ATTEMPTS = 5
+STATUS_BATCH_SIZE = 1000
+
+
+def _generate_username(base: str) -> str:
+    # one upsert per registration however common the name is; the row lock serializes concurrent registrations
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {UsernameCounters._meta.db_table} (base, value) VALUES (%s, 0) "
+            f"ON CONFLICT (base) DO UPDATE SET value = {UsernameCounters._meta.db_table}.value + 1 "
+            "RETURNING value",
+            [base],
+        )
+        (value,) = cursor.fetchone()
+    return f"{base}_{value}" if value else base
+
+
+def _create_user(fields: dict) -> Users:
+    if fields.get("username"):
+        return Users.objects.create_user(**fields)
+
+    initials = (fields.get("first_name") or "")[:1] + (fields.get("middle_name") or "")[:1]
+    base = f"{fields.get("last_name")}_{initials}"
+    for attempt in range(USERNAME_ATTEMPTS):
+        fields["username"] = _generate_username(base)
+        try:
+            with transaction.atomic():
+                return Users.objects.create_user(**fields)
+        except IntegrityError:
+            # the name was taken outside of the counter (set by hand or created before it existed)
+            if attempt == USERNAME_ATTEMPTS - 1:
+                raise
+
+
+class ClinicSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Clinics
         fields = "__all__"
@@ -27,7 +69,7 @@ class UsersSerializer(serializers.ModelSerializer):
         fields = ("id", "first_name", "last_name", "middle_name", "email")
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UsersSerializer()
 
     class Meta:
@@ -35,9 +77,7 @@ class PatientSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def create(self, validated_data):
-        user_data = validated_data.pop("user")
-        _ensure_username_or_generate(user_data)
-        user = Users.objects.create_user(**user_data)
+        user = _create_user(validated_data.pop("user"))
         patient = Patients.objects.create(user=user, **validated_data)
         return patient
 
@@ -47,19 +87,19 @@ class PatientSerializer(serializers.ModelSerializer):
         return instance
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UsersSerializer()
     read_only = True
 
     class Meta:
         model = Doctors
         fields = "__all__"
+        expandable = {"clinics": partial(ClinicSerializer, many=True, read_only=True)}
 
     def create(self, validated_data):
         user_data = validated_data.pop("user")
         clinics_data = validated_data.pop("clinics", [])
-        _ensure_username_or_generate(user_data)
-        user = Users.objects.create_user(**user_data)
+        user = _create_user(user_data)
         doctor = Doctors.objects.create(user=user, **validated_data)
         doctor.clinics.set(clinics_data)
         return doctor
@@ -70,7 +110,109 @@ class DoctorSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ConsultationsSerializer(serializers.ModelSerializer):
+class ConsultationsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Consultations
         fields = ("doctor", "patient", "clinic", "start_time", "end_time", "status", "created_at", "notes")
+        expandable = {
+            "doctor": partial(DoctorSerializer, read_only=True),
+            "patient": partial(PatientSerializer, read_only=True),
+            "clinic": partial(ClinicSerializer, read_only=True),
+        }
+
+    def update(self, instance, validated_data):
+        # set by the view from If-Match, the write is skipped if somebody has saved the consultation since
+        unmodified_since = self.context.get("unmodified_since")
+        if unmodified_since is None:
+            return super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        if not instance.save_if_unmodified(unmodified_since):
+            raise PreconditionFailed()
+        return instance
+
+    def save(self, **kwargs):
+        # overlapping bookings are rejected by the overlap constraints of the partitions and the consultation_no_overlap
+        # trigger across months, no locks needed here
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as e:
+            if getattr(e.__cause__, "sqlstate", None) == EXCLUSION_VIOLATION:
+                raise ConsultationOverlap()
+            raise
+
+
+class RangeQuerySerializer(serializers.Serializer):
+    def get_fields(self):
+        # `from` is a keyword, so the field is declared as `from_` and renamed here
+        fields = super().get_fields()
+        fields["from"] = fields.pop("from_")
+        return fields
+
+
+class FreeSlotsQuerySerializer(RangeQuerySerializer):
+    from_ = serializers.DateTimeField()
+    to = serializers.DateTimeField()
+    duration = serializers.IntegerField(min_value=1, default=30, help_text="minutes")
+    clinic = serializers.PrimaryKeyRelatedField(queryset=Clinics.objects.all(), required=False)
+
+    def validate(self, attrs):
+        if attrs["to"] <= attrs["from"]:
+            raise serializers.ValidationError({"to": "Must be later than 'from'."})
+        return attrs
+
+
+class FreeSlotSerializer(serializers.Serializer):
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+
+class CalendarQuerySerializer(RangeQuerySerializer):
+    MAX_RANGE = timedelta(days=31)
+
+    clinic = serializers.IntegerField()
+    from_ = serializers.DateTimeField()
+    to = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        if attrs["to"] <= attrs["from"]:
+            raise serializers.ValidationError({"to": "Must be later than 'from'."})
+        if attrs["to"] - attrs["from"] > self.MAX_RANGE:
+            raise serializers.ValidationError({"to": f"The range can't be longer than {self.MAX_RANGE.days} days."})
+        return attrs
+
+
+class AnalyticsQuerySerializer(RangeQuerySerializer):
+    GROUP_BY = ("clinic", "doctor", "day")
+
+    from_ = serializers.DateField()
+    to = serializers.DateField(help_text="inclusive")
+    clinic = serializers.IntegerField(required=False)
+    doctor = serializers.IntegerField(required=False)
+    group_by = serializers.MultipleChoiceField(choices=GROUP_BY, required=False, help_text="all by default")
+
+    def validate(self, attrs):
+        if attrs["to"] < attrs["from"]:
+            raise serializers.ValidationError({"to": "Must not be earlier than 'from'."})
+        # an absent query parameter comes as an empty list
+        attrs["group_by"] = [field for field in self.GROUP_BY if field in (attrs.get("group_by") or self.GROUP_BY)]
+        return attrs
+
+
+class StatusTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Consultations.STATUS_CHOICES)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=STATUS_BATCH_SIZE
+    )
+
+
+class ConsultationImportSerializer(serializers.ModelSerializer):
+    # related ids are checked once per chunk by the importer instead of a query per row
+    doctor = serializers.IntegerField()
+    patient = serializers.IntegerField()
+    clinic = serializers.IntegerField()
+
+    class Meta:
+        model = Consultations
+        fields = ("doctor", "patient", "clinic", "start_time", "end_time", "status", "notes")
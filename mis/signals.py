@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from mis.authentication import AUTH_CLAIMS, revoke_tokens
+from mis.caching import invalidate_on_commit
+from mis.models import Clinics, Users
+
+REVOKING_FIELDS = AUTH_CLAIMS + ("is_active",)
+
+
+@receiver([post_save, post_delete], sender=Clinics)
+def invalidate_clinics(sender, **kwargs):
+    invalidate_on_commit("clinics")
+
+
+@receiver(pre_save, sender=Users)
+def remember_auth_fields(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._auth_fields = None
+        return
+    instance._auth_fields = sender.objects.filter(pk=instance.pk).values(*REVOKING_FIELDS, "auth_version").first()
+    if instance._auth_fields is not None:
+        # a stale instance must not write back a version revoked in between
+        instance.auth_version = instance._auth_fields["auth_version"]
+
+
+@receiver(post_save, sender=Users)
+def revoke_changed_user_tokens(sender, instance, created, **kwargs):
+    stored = getattr(instance, "_auth_fields", None)
+    if created or stored is None:
+        return
+    if any(stored[field] != getattr(instance, field) for field in REVOKING_FIELDS):
+        revoke_tokens(instance)
+
+
+@receiver(post_delete, sender=Users)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_tokens(instance)
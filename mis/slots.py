@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta
+from typing import Iterable
+
+
+def free_slots(
+    busy: Iterable[tuple[datetime, datetime]], start: datetime, end: datetime, duration: timedelta
+) -> list[tuple[datetime, datetime]]:
+    """Gaps of at least `duration` inside [start, end) not covered by `busy` intervals sorted by start."""
+    slots = []
+    cursor = start
+    for busy_start, busy_end in busy:
+        if busy_start - cursor >= duration:
+            slots.append((cursor, busy_start))
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            return slots
+    if end - cursor >= duration:
+        slots.append((cursor, end))
+    return slots
@@ -0,0 +1,121 @@
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField
+
+FIELDS_PARAM = "fields"
+EXPAND_PARAM = "expand"
+
+
+def _names(value):
+    return tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+
+
+def _tree(names):
+    # ("id", "user.last_name") -> {"id": {}, "user": {"last_name": {}}}, an empty dict keeps the whole field
+    tree = {}
+    for name in names:
+        node = tree
+        for part in name.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def _trim(fields, tree, path=""):
+    unknown = [f"{path}{name}" for name in tree if name not in fields]
+    if unknown:
+        raise serializers.ValidationError({FIELDS_PARAM: [f"Unknown field {name}." for name in unknown]})
+    for name in list(fields):
+        if name not in tree:
+            del fields[name]
+        elif tree[name]:
+            field = fields[name]
+            if isinstance(field, serializers.ListSerializer):
+                field = field.child
+            if not isinstance(field, serializers.BaseSerializer):
+                raise serializers.ValidationError({FIELDS_PARAM: [f"{path}{name} has no fields."]})
+            _trim(field.fields, tree[name], f"{path}{name}.")
+
+
+class SparseFieldsMixin:
+    """
+    Trims and expands the fields of a top level serializer by `fields` and `expand` in its context.
+
+    `fields` are names of the fields to keep, dotted ones reach into nested serializers (`user.last_name`).
+    `expand` names relations of `Meta.expandable` to embed with the serializer given there, instead of
+    the primary keys. Both are read only, see `SparseFieldsViewMixin`.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if parent is not None:
+            # nested, the parameters are about the top level serializer
+            return fields
+        expandable = getattr(self.Meta, "expandable", {})
+        for name in self.context.get(EXPAND_PARAM, ()):
+            if name not in expandable:
+                raise serializers.ValidationError({EXPAND_PARAM: [f"{name} can't be expanded."]})
+            fields[name] = expandable[name]()
+        if self.context.get(FIELDS_PARAM) is not None:
+            _trim(fields, _tree(self.context[FIELDS_PARAM]))
+        return fields
+
+
+def trim_queryset(queryset, serializer, required=()):
+    """
+    Loads only the columns `serializer` reads: `.only()` of its fields, joins of its nested serializers
+    and prefetches of its many relations, in primary key order like the list fast path.
+
+    `required` are further fields of the model the view reads itself, e.g. for the ETag.
+    """
+    only, related, prefetch = list(required), [], []
+
+    def walk(serializer, model, prefix):
+        for field in serializer._readable_fields:
+            path = prefix + "__".join(field.source_attrs)
+            if isinstance(field, (serializers.ListSerializer, ManyRelatedField)):
+                related_model = model._meta.get_field(field.source).related_model
+                prefetch.append(Prefetch(path, queryset=related_model.objects.order_by("pk")))
+            elif isinstance(field, serializers.BaseSerializer):
+                only.append(path)
+                related.append(path)
+                walk(field, field.Meta.model, f"{path}__")
+            else:
+                only.append(path)
+
+    walk(serializer, queryset.model, "")
+    queryset = queryset.select_related(None).prefetch_related(None)
+    return queryset.select_related(*related).prefetch_related(*prefetch).only(*only)
+
+
+class SparseFieldsViewMixin:
+    """
+    `?fields=` and `?expand=` for reads, passed to a `SparseFieldsMixin` serializer.
+
+    With either of them the filtered queryset of `list`/`retrieve` loads only what the serializer reads
+    and `sparse_required_fields`, without them the queryset and the output stay as they are.
+    """
+
+    # fields the view reads outside of the serializer, loaded even if they aren't asked for
+    sparse_required_fields = ()
+
+    def get_sparse_fields(self) -> tuple[tuple[str, ...] | None, tuple[str, ...]]:
+        request = getattr(self, "request", None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, ()
+        params = request.query_params
+        fields = _names(params[FIELDS_PARAM]) if FIELDS_PARAM in params else None
+        return fields, _names(params.get(EXPAND_PARAM, ""))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context[FIELDS_PARAM], context[EXPAND_PARAM] = self.get_sparse_fields()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields, expand = self.get_sparse_fields()
+        if self.action in ("list", "retrieve") and (fields is not None or expand):
+            return trim_queryset(queryset, self.get_serializer(), self.sparse_required_fields)
+        return queryset
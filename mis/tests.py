@@ -1,17 +1,70 @@
 # Create your tests here.
 # tests/test_api.py
-from datetime import datetime, timedelta
+import io
+import json
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from time import sleep
+from zoneinfo import ZoneInfo
 
 import pytest
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings as django_settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import Count, F, Sum
+from django.utils import timezone
 from django.utils.crypto import get_random_string
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from mis.models import Doctors, Patients, Clinics, Users, Consultations
+from mis import renderers, seeding
+from mis.authentication import user_cache
+from mis.fast_serializers import ValuesSerializer
+from mis.models import Doctors, Patients, Clinics, Users, Consultations, ConsultationStats
+from mis.partitions import (
+    PARENT, add_months, archive_partitions, ensure_partitions, month_start, monthly_partitions, partition_name,
+)
+from mis.routers import REPLICA_DB_ALIAS
+from mis.serializers import ClinicSerializer, ConsultationOverlap, ConsultationsSerializer
+from mis.sparse import trim_queryset
+from mis.views import ConsultationViewSet, DoctorsViewSet, PatientsViewSet
 
 import random
 
 
+@pytest.fixture(autouse=True)
+def fast_password_hasher(settings):
+    settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    user_cache.clear()
+    yield
+    cache.clear()
+    user_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def primary_only(request, settings):
+    # only the tests that ask for the replica database read from it
+    marker = request.node.get_closest_marker("django_db")
+    databases = marker.kwargs.get("databases", ()) if marker else ()
+    if REPLICA_DB_ALIAS in settings.DATABASES and REPLICA_DB_ALIAS not in databases:
+        settings.DATABASES = {alias: db for alias, db in settings.DATABASES.items() if alias != REPLICA_DB_ALIAS}
+
+
 @pytest.fixture
 def create_user():
     def _create_user(role="patient", password=None) -> Users:
@@ -69,6 +122,56 @@ def api_client_with_token(create_user):
     return _create_api_client
 
 
+@pytest.mark.django_db
+def test_jwt_carries_role_claims(api_client_with_token, settings):
+    settings.AUTH_TRUST_TOKEN_CLAIMS = True
+    client, admin = api_client_with_token("admin")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/api/clinics/")
+    assert response.status_code == 200
+    assert not [q for q in queries.captured_queries if "mis_users" in q["sql"]]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("trust_claims", [True, False])
+def test_jwt_revoked_on_role_change(api_client_with_token, settings, trust_claims):
+    settings.AUTH_TRUST_TOKEN_CLAIMS = trust_claims
+    client, admin = api_client_with_token("admin")
+    assert client.get("/api/consultations/").status_code == 200
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get("/api/consultations/").status_code == 200
+    assert not [q for q in queries.captured_queries if 'FROM "mis_users"' in q["sql"]]
+
+    admin.role = "patient"
+    admin.save()
+    assert client.get("/api/consultations/").status_code == 401
+    # the version is kept in the database, a lost cache doesn't bring the token back
+    cache.clear()
+    assert client.get("/api/consultations/").status_code == 401
+
+    admin.set_password("newpass123")
+    admin.save()
+    response = client.post("/api/token/", {"username": admin.username, "password": "newpass123"})
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    assert client.get("/api/consultations/").status_code == 403
+
+    admin.is_active = False
+    admin.save()
+    assert client.get("/api/consultations/").status_code == 401
+
+
+@pytest.mark.django_db
+def test_user_cache_returns_copies(create_user):
+    user = create_user(role="admin")
+    user_cache.set(user.pk, user)
+    user.role = "patient"
+    cached = user_cache.get(user.pk)
+    assert cached.role == "admin"
+    cached.role = "patient"
+    assert user_cache.get(user.pk).role == "admin"
+
+
 @pytest.mark.django_db
 def test_role_access(api_client_with_token):
     client_patient, _ = api_client_with_token("patient")
@@ -162,6 +265,28 @@ def test_create_consultation(api_client_with_token, doctor, patient, clinic):
     assert response.data["status"] == "waiting"
 
 
+@pytest.mark.skipif(
+    REPLICA_DB_ALIAS not in django_settings.DATABASES,
+    reason="needs a second database, e.g. POSTGRES_REPLICA_HOST=localhost POSTGRES_REPLICA_DB=swgroup_replica",
+)
+@pytest.mark.django_db(databases=["default", REPLICA_DB_ALIAS])
+def test_replica_reads(api_client_with_token, doctor, patient, clinic):
+    # the test replica is a separate empty database, so the row count tells where the list was read from
+    writer, user = api_client_with_token(role="admin")
+    reader, _ = api_client_with_token(role="admin")
+    data = {"doctor": doctor.id, "patient": patient.id, "clinic": clinic.id, "start_time": "2025-06-20T10:00:00Z"}
+    response = writer.post("/api/consultations/", data)
+    assert response.status_code == 201
+
+    assert writer.get("/api/consultations/").data["count"] == 1
+    assert reader.get("/api/consultations/").data["count"] == 0
+    assert reader.get("/api/async/consultations/").json()["count"] == 0
+
+    # the sticky window is over
+    cache.clear()
+    assert writer.get("/api/consultations/").data["count"] == 0
+
+
 @pytest.mark.django_db
 def test_deny_create_consultation(api_client_with_token, doctor, patient, clinic):
     client, user = api_client_with_token(role="patient")
@@ -254,3 +379,1118 @@ def test_order_consultations_by_start_time(api_client_with_token, create_bunch_c
     response = client.get("/api/consultations/?ordering=-start_time")
     result = response.data["results"]
     assert datetime.fromisoformat(result[0]["start_time"]) > datetime.fromisoformat(result[1]["start_time"])
+
+
+@pytest.mark.django_db
+def test_change_status_follows_transitions(api_client_with_token, doctor, patient, clinic, create_consultation):
+    consultation = create_consultation(datetime.fromisoformat("2026-06-20T10:00:00Z"), doctor, patient, clinic, "paid")
+    client, user = api_client_with_token(role="admin")
+    response = client.post(f"/api/consultations/{consultation.id}/change_status/", {"status": "waiting"})
+    assert response.status_code == 400
+    assert response.data == {"error": "Can't change status from 'paid' to 'waiting'."}
+
+    consultation.status = "finished"
+    consultation.save()
+    response = client.post(f"/api/consultations/{consultation.id}/change_status/", {"status": "paid"})
+    assert response.status_code == 200
+    consultation.refresh_from_db()
+    assert consultation.status == "paid"
+
+
+@pytest.mark.django_db
+def test_consultation_if_match(api_client_with_token, doctor, patient, clinic, create_consultation):
+    consultation = create_consultation(datetime.fromisoformat("2026-06-20T10:00:00Z"), doctor, patient, clinic)
+    url = f"/api/consultations/{consultation.id}/"
+    client, user = api_client_with_token(role="admin")
+    etag = client.get(url)["ETag"]
+    assert etag == consultation.etag
+
+    response = client.patch(url, {"notes": "first"}, HTTP_IF_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    # the second receptionist has seen the consultation before the first edit
+    response = client.patch(url, {"notes": "second"}, HTTP_IF_MATCH=etag)
+    assert response.status_code == 412
+    response = client.post(f"{url}change_status/", {"status": "confirmed"}, HTTP_IF_MATCH=etag)
+    assert response.status_code == 412
+    consultation.refresh_from_db()
+    assert (consultation.notes, consultation.status) == ("first", "waiting")
+
+    response = client.post(f"{url}change_status/", {"status": "confirmed"}, HTTP_IF_MATCH=consultation.etag)
+    assert response.status_code == 200
+    assert client.get(url)["ETag"] == response["ETag"]
+    assert client.patch(url, {"notes": "any"}, HTTP_IF_MATCH="*").status_code == 200
+
+
+@pytest.mark.django_db
+def test_consultation_moved(api_client_with_token, doctor, patient, clinic, create_consultation):
+    consultation = create_consultation(datetime.fromisoformat("2026-06-20T10:00:00Z"), doctor, patient, clinic)
+    url = f"/api/consultations/{consultation.id}/"
+    client, user = api_client_with_token(role="admin")
+
+    # an end time before the new start is reset to the default duration
+    response = client.patch(url, {"start_time": "2026-06-21T10:00:00Z"})
+    assert response.status_code == 200
+    assert response.data["end_time"] == "2026-06-21T10:30:00Z"
+    Consultations.objects.filter(pk=consultation.pk).update(end_time=None)
+    response = client.patch(url, {"start_time": "2026-06-22T10:00:00Z"})
+    assert response.status_code == 200
+    assert response.data["end_time"] == "2026-06-22T10:30:00Z"
+
+
+@pytest.mark.django_db
+def test_save_if_unmodified(doctor, patient, clinic, create_consultation):
+    consultation = create_consultation(datetime.fromisoformat("2026-06-20T10:00:00Z"), doctor, patient, clinic)
+    first, second = Consultations.objects.get(pk=consultation.pk), Consultations.objects.get(pk=consultation.pk)
+    first.notes, second.notes = "first", "second"
+    assert first.save_if_unmodified(consultation.updated_at)
+    assert not second.save_if_unmodified(consultation.updated_at)
+    consultation.refresh_from_db()
+    assert consultation.notes == "first"
+    assert consultation.updated_at == first.updated_at
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url", ["/api/consultations/", "/api/async/consultations/"])
+def test_consultation_list_not_modified(api_client_with_token, create_bunch_consultation, url):
+    client, user = api_client_with_token(role="admin")
+    response = client.get(url, {"status": "waiting"})
+    etag = response["ETag"]
+    assert response.status_code == 200 and response["Last-Modified"]
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, {"status": "waiting"}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+    (query,) = [query["sql"] for query in queries if "mis_consultations" in query["sql"]]
+    assert "COUNT(" in query and "notes" not in query
+    assert client.get(url, {"status": "paid"}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    # If-Modified-Since alone can't tell about deletes
+    response = client.get(url, {"status": "waiting"}, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+    assert response.status_code == 200
+
+    waiting = Consultations.objects.filter(status="waiting")
+    # committed later than a newer change, with an older updated_at
+    waiting.update(updated_at=F("updated_at") - timedelta(seconds=1))
+    response = client.get(url, {"status": "waiting"}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and response["ETag"] != etag
+    etag = response["ETag"]
+    waiting.delete()
+    response = client.get(url, {"status": "waiting"}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and response["ETag"] != etag
+    assert not client.get(url, {"expand": "doctor"}).has_header("ETag")
+    assert not client.get(url, {"cursor": ""}).has_header("ETag")
+
+
+@pytest.mark.django_db
+def test_bulk_change_status(api_client_with_token, doctor, patient, clinic):
+    start = datetime.fromisoformat("2026-06-20T10:00:00Z")
+    statuses = ["started"] * 497 + ["waiting", "finished", "paid"]
+    consultations = Consultations.objects.bulk_create(
+        Consultations(
+            doctor=doctor, patient=patient, clinic=clinic, status=status,
+            start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i, minutes=30),
+        )
+        for i, status in enumerate(statuses)
+    )
+    ids = [consultation.id for consultation in consultations] + [10**9, consultations[0].id]
+    client, user = api_client_with_token(role="admin")
+    client.get("/api/consultations/?limit=1")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post("/api/consultations/change_status/", {"status": "finished", "ids": ids}, format="json")
+    assert response.status_code == 200
+    assert len(queries) == 1
+    results = response.data["results"]
+    assert len(results) == 501
+    assert all(result["updated"] for result in results[:497])
+    assert [(result["id"], result.get("status"), result["updated"]) for result in results[497:]] == [
+        (ids[497], "waiting", False),
+        (ids[498], "finished", False),
+        (ids[499], "paid", False),
+        (10**9, None, False),
+    ]
+    assert results[497]["error"] == "Can't change status from 'waiting' to 'finished'."
+    assert results[-1]["error"] == "Not found."
+    assert Consultations.objects.filter(status="finished").count() == 498
+
+    response = client.post("/api/consultations/change_status/", {"status": "unknown", "ids": []}, format="json")
+    assert response.status_code == 400
+    assert set(response.data) == {"status", "ids"}
+
+
+@pytest.mark.django_db
+def test_consultations_calendar(api_client_with_token, create_doctor, create_patient, create_clinic):
+    clinic, other_clinic = create_clinic(), create_clinic()
+    doctor, other = create_doctor(), create_doctor()
+    patients = [create_patient(), create_patient()]
+    start = datetime.fromisoformat("2026-06-22T00:00:00Z")
+    for doc, cons_clinic, hours, status, patient in [
+        (other, clinic, 9, "paid", patients[1]),
+        (doctor, clinic, 10, "waiting", patients[0]),
+        (doctor, clinic, 34, "confirmed", patients[1]),
+        (doctor, other_clinic, 12, "waiting", patients[0]),
+        (doctor, clinic, 24 * 7, "waiting", patients[0]),
+    ]:
+        Consultations.objects.create(
+            doctor=doc, patient=patient, clinic=cons_clinic, status=status, start_time=start + timedelta(hours=hours)
+        )
+    client, user = api_client_with_token(role="admin")
+    client.get("/api/consultations/?limit=1")
+
+    params = {"clinic": clinic.id, "from": "2026-06-22T00:00:00Z", "to": "2026-06-29T00:00:00Z"}
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/api/consultations/calendar/", params)
+    assert response.status_code == 200
+    assert len(queries) == 1
+    assert response.data["statuses"] == ["waiting", "confirmed", "started", "finished", "paid"]
+    assert response.data["doctors"] == [
+        {
+            "doctor": doctor.id,
+            "start": [600, 2040],
+            "end": [630, 2070],
+            "status": [0, 1],
+            "patient": [patient.id for patient in patients],
+        },
+        {"doctor": other.id, "start": [540], "end": [570], "status": [4], "patient": [patients[1].id]},
+    ]
+
+    # a consultation without end_time lasts the default duration
+    Consultations.objects.filter(doctor=other).update(end_time=None)
+    response = client.get("/api/consultations/calendar/", params)
+    assert response.status_code == 200
+    assert response.data["doctors"][1]["end"] == [570]
+
+    params["to"] = "2026-08-01T00:00:00Z"
+    assert client.get("/api/consultations/calendar/", params).status_code == 400
+
+
+@pytest.mark.django_db
+def test_doctor_free_slots(api_client_with_token, doctor, patient, clinic, create_consultation):
+    doctor.clinics.add(clinic)
+    for start_time in ["2026-06-20T10:00:00Z", "2026-06-20T10:30:00Z", "2026-06-20T12:00:00Z"]:
+        create_consultation(
+            start_time=datetime.fromisoformat(start_time), doctor=doctor, patient=patient, clinic=clinic
+        )
+
+    client, user = api_client_with_token(role="admin")
+    response = client.get(
+        f"/api/doctors/{doctor.id}/free-slots/",
+        {"from": "2026-06-20T09:00:00Z", "to": "2026-06-20T13:00:00Z", "duration": 60, "clinic": clinic.id},
+    )
+    assert response.status_code == 200
+    assert [(slot["start_time"], slot["end_time"]) for slot in response.data] == [
+        ("2026-06-20T09:00:00Z", "2026-06-20T10:00:00Z"),
+        ("2026-06-20T11:00:00Z", "2026-06-20T12:00:00Z"),
+    ]
+
+    # a consultation without end_time lasts the default duration, like in the calendar
+    Consultations.objects.filter(doctor=doctor, start_time="2026-06-20T12:00:00Z").update(end_time=None)
+    response = client.get(
+        f"/api/doctors/{doctor.id}/free-slots/",
+        {"from": "2026-06-20T09:00:00Z", "to": "2026-06-20T14:00:00Z", "duration": 60},
+    )
+    assert response.status_code == 200
+    assert response.data[-1] == {"start_time": "2026-06-20T12:30:00Z", "end_time": "2026-06-20T14:00:00Z"}
+    response = client.get(f"/api/async/doctors/{doctor.id}/free-slots/", {
+        "from": "2026-06-20T13:00:00Z", "to": "2026-06-20T14:00:00Z", "duration": 60,
+    })
+    assert response.json() == [{"start_time": "2026-06-20T13:00:00Z", "end_time": "2026-06-20T14:00:00Z"}]
+
+
+@pytest.mark.django_db
+def test_doctor_free_slots_validation(api_client_with_token, doctor, create_clinic):
+    client, user = api_client_with_token(role="admin")
+    url = f"/api/doctors/{doctor.id}/free-slots/"
+    response = client.get(url, {"from": "2026-06-20T13:00:00Z", "to": "2026-06-20T09:00:00Z"})
+    assert response.status_code == 400
+    response = client.get(
+        url, {"from": "2026-06-20T09:00:00Z", "to": "2026-06-20T13:00:00Z", "clinic": create_clinic().id}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url",
+    [
+        "consultations/",
+        "consultations/?limit=2&offset=1&status__in=waiting,paid",
+        "consultations/?cursor=&limit=2&ordering=start_time",
+        "consultations/?search=Петров&search_type=doctor",
+        "consultations/{consultation}/",
+        "consultations/0/",
+        "doctors/{doctor}/free-slots/?from=2020-01-01T00:00:00Z&to=2040-01-01T00:00:00Z&duration=60",
+        "doctors/{doctor}/free-slots/?from=2020-01-01T00:00:00Z&to=2019-01-01T00:00:00Z",
+    ],
+)
+def test_async_reads_match_sync(api_client_with_token, create_bunch_consultation, url):
+    consultation = Consultations.objects.order_by("start_time").first()
+    url = url.format(consultation=consultation.pk, doctor=consultation.doctor_id)
+    client, user = api_client_with_token(role="admin")
+
+    response = client.get(f"/api/{url}")
+    async_response = client.get(f"/api/async/{url}")
+    assert async_response.status_code == response.status_code
+    assert async_response.json() == json.loads(
+        json.dumps(response.json()).replace("/api/consultations/", "/api/async/consultations/")
+    )
+
+
+@pytest.mark.django_db
+def test_async_reads_permissions(api_client_with_token, create_bunch_consultation):
+    assert APIClient().get("/api/async/consultations/").status_code == 401
+    client, user = api_client_with_token(role="patient")
+    assert client.get("/api/async/consultations/").status_code == 403
+
+
+@pytest.mark.django_db
+def test_overlapping_consultation_conflict(api_client_with_token, doctor, create_patient, clinic):
+    client, user = api_client_with_token(role="admin")
+    data = {"doctor": doctor.id, "patient": create_patient().id, "clinic": clinic.id}
+    response = client.post("/api/consultations/", {**data, "start_time": "2026-06-20T10:00:00Z"})
+    assert response.status_code == 201
+    response = client.post("/api/consultations/", {**data, "start_time": "2026-06-20T10:15:00Z"})
+    assert response.status_code == 409
+    # [10:00, 10:30) and [10:30, 11:00) only touch
+    response = client.post("/api/consultations/", {**data, "start_time": "2026-06-20T10:30:00Z"})
+    assert response.status_code == 201
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_booking_stress(create_user, create_doctor, patient, clinic):
+    admin = create_user(role="admin")
+    doctors = [create_doctor() for _ in range(4)]
+    slots = [f"2026-06-20T{hour}:00:00Z" for hour in range(9, 14)]
+    attempts = 5
+
+    def book(doctor_and_slot):
+        doctor, start_time = doctor_and_slot
+        client = APIClient()
+        client.force_authenticate(admin)
+        data = {"doctor": doctor.id, "patient": patient.id, "clinic": clinic.id, "start_time": start_time}
+        try:
+            return doctor.id, start_time, client.post("/api/consultations/", data).status_code
+        finally:
+            connection.close()
+
+    jobs = [(doctor, start_time) for doctor in doctors for start_time in slots for _ in range(attempts)]
+    random.shuffle(jobs)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(book, jobs))
+
+    assert {code for _, _, code in results} == {201, 409}
+    for doctor in doctors:
+        for start_time in slots:
+            codes = sorted(code for doc_id, slot, code in results if doc_id == doctor.id and slot == start_time)
+            assert codes == [201] + [409] * (attempts - 1)
+    assert Consultations.objects.count() == len(doctors) * len(slots)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bench_booking_command():
+    stdout = io.StringIO()
+    call_command("bench_booking", workers=[1, 2], attempts=[1, 3], doctors=2, slots=2, stdout=stdout)
+    lines = stdout.getvalue().splitlines()
+    # 2 doctors * 2 slots booked, the extra attempts rejected
+    assert [line.split()[1:3] for line in lines[1:5]] == [["0%", "4"], ["67%", "12"]] * 2
+    assert all(line.split()[-1] == "0" for line in lines[1:5])
+    assert "slowest run handled" in lines[-1]
+    assert not Consultations.objects.exists() and not Users.objects.exists()
+
+
+@pytest.mark.django_db
+def test_consultations_cursor_pagination(
+    api_client_with_token, create_bunch_consultation, create_consultation, create_doctor, patient, clinic
+):
+    start_time = Consultations.objects.first().start_time
+    create_consultation(start_time=start_time, doctor=create_doctor(), patient=patient, clinic=clinic)
+    client, user = api_client_with_token(role="admin")
+    expected = client.get("/api/consultations/").data["results"]
+
+    pages = []
+    url = "/api/consultations/?cursor=&limit=2"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert "count" not in response.data
+        pages.append(response.data["results"])
+        url = response.data["next"]
+    assert [len(page) for page in pages] == [2, 2, 2]
+    rows = [row for page in pages for row in page]
+    assert sorted(rows, key=repr) == sorted(expected, key=repr)
+    assert [row["start_time"] for row in rows] == sorted((row["start_time"] for row in rows), reverse=True)
+
+    response = client.get("/api/consultations/?cursor=broken")
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def count_queries():
+    def _count_queries(client, url) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    return _count_queries
+
+
+@pytest.fixture
+def populate_mis(create_doctor, create_patient, create_clinic, create_consultation):
+    def _populate_mis(count):
+        clinic = create_clinic()
+        for i in range(count):
+            doctor = create_doctor()
+            doctor.user.last_name = "Иванов"
+            doctor.user.save()
+            doctor.clinics.add(clinic, create_clinic())
+            create_consultation(
+                start_time=datetime.now() + timedelta(days=i), doctor=doctor, patient=create_patient(), clinic=clinic
+            )
+
+    return _populate_mis
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url, budget",
+    [
+        # count + page (+ prefetch of doctor clinics), the user is cached by the authentication
+        ("/api/clinics/", 2),
+        ("/api/users/", 2),
+        ("/api/doctors/", 3),
+        ("/api/consultations/", 2),
+        ("/api/consultations/?search=Иванов", 2),
+        ("/api/consultations/?doctor__user__last_name=Иванов&status=waiting&ordering=start_time", 2),
+    ],
+)
+def test_list_query_budget(api_client_with_token, populate_mis, count_queries, url, budget):
+    client, user = api_client_with_token(role="admin")
+    client.get("/api/consultations/")
+    populate_mis(2)
+    small_page = count_queries(client, url)
+    populate_mis(10)
+    assert count_queries(client, url) == small_page <= budget
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "viewset_class, fields, expand",
+    [
+        (ConsultationViewSet, None, ()),
+        (DoctorsViewSet, None, ()),
+        (PatientsViewSet, None, ()),
+        (ConsultationViewSet, None, ("clinic", "doctor", "patient")),
+        (ConsultationViewSet, ("doctor.clinics", "doctor.user.last_name", "start_time"), ("doctor",)),
+        (DoctorsViewSet, ("id", "user.email"), ()),
+    ],
+)
+def test_values_serializer_matches(populate_mis, viewset_class, fields, expand):
+    populate_mis(5)
+    Consultations.objects.filter(pk=Consultations.objects.first().pk).update(notes="Заметка", end_time=None)
+    view = viewset_class(action="list")
+    serializer_class = view.get_serializer_class()
+    context = {"fields": fields, "expand": expand}
+    queryset = trim_queryset(view.get_queryset().order_by("pk"), serializer_class(context=context))
+    values = ValuesSerializer.for_serializer(serializer_class, fields, expand)
+
+    for time_zone in ["UTC", "Europe/Moscow"]:
+        with timezone.override(time_zone):
+            expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+            assert JSONRenderer().render(values.to_representation(values.queryset(queryset))) == expected
+    assert values.to_representation(values.queryset(queryset.none())) == []
+
+
+@pytest.mark.django_db
+def test_sparse_fields(api_client_with_token, create_bunch_consultation, clinic):
+    client, user = api_client_with_token(role="admin")
+    client.get("/api/consultations/")
+    consultation = Consultations.objects.first()
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/api/consultations/", {"fields": "start_time,end_time", "cursor": ""})
+    assert response.status_code == 200
+    assert set(response.data["results"][0]) == {"start_time", "end_time"}
+    assert response.data["next"] is None
+    (page_query,) = [query["sql"] for query in queries if "mis_consultations" in query["sql"]]
+    assert "notes" not in page_query and "JOIN" not in page_query
+
+    params = {"fields": "start_time,doctor.user.last_name,clinic.name", "expand": "doctor,clinic"}
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(f"/api/consultations/{consultation.id}/", params)
+    assert response.data == {
+        "start_time": response.data["start_time"],
+        "doctor": {"user": {"last_name": consultation.doctor.user.last_name}},
+        "clinic": {"name": clinic.name},
+    }
+    assert "notes" not in queries[-1]["sql"] and "mis_patients" not in queries[-1]["sql"]
+    # the ETag is read from the same query, also without updated_at in the fields
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(f"/api/consultations/{consultation.id}/", {"fields": "status"})
+    assert response.data == {"status": consultation.status}
+    assert response["ETag"] == consultation.etag
+    assert len(queries) == 1
+    response = client.get(f"/api/async/consultations/{consultation.id}/", {"fields": "status"})
+    assert response.status_code == 200
+    assert response["ETag"] == consultation.etag
+    response = client.get("/api/consultations/", {"expand": "patient", "limit": 1})
+    assert response.data["results"][0]["patient"]["user"]["id"] == consultation.patient.user_id
+    response = client.get("/api/async/consultations/", {"expand": "doctor", "fields": "doctor.clinics", "limit": 1})
+    assert response.status_code == 200
+    assert json.loads(response.content)["results"][0] == {"doctor": {"clinics": []}}
+
+    # doctors without the nested user don't join it, expanded clinics go through the serializer
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/api/doctors/", {"fields": "id,specialization"})
+    assert set(response.data["results"][0]) == {"id", "specialization"}
+    assert all("mis_users" not in query["sql"] for query in queries)
+    consultation.doctor.clinics.add(clinic)
+    response = client.get(f"/api/doctors/{consultation.doctor_id}/", {"expand": "clinics", "fields": "clinics.name"})
+    assert response.data == {"clinics": [{"name": clinic.name}]}
+    response = client.get("/api/doctors/", {"expand": "clinics", "fields": "id,clinics"})
+    assert {"id": consultation.doctor_id, "clinics": [ClinicSerializer(clinic).data]} in response.data["results"]
+    assert set(client.get("/api/clinics/", {"fields": "name"}).data["results"][0]) == {"name"}
+
+    for params in [{"fields": "unknown"}, {"fields": "status.name"}, {"expand": "status"}]:
+        assert client.get("/api/consultations/", params).status_code == 400
+    # writes ignore the parameters
+    response = client.patch(f"/api/consultations/{consultation.id}/?fields=notes&expand=doctor", {"notes": "Заметка"})
+    assert response.data["doctor"] == consultation.doctor_id
+
+
+@pytest.mark.django_db
+def test_bench_serialization_command(populate_mis):
+    populate_mis(2)
+    stdout = io.StringIO()
+    call_command("bench_serialization", rows=[2], repeat=1, stdout=stdout)
+    assert "serializing" in stdout.getvalue()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("fast_library", [True, False])
+def test_fast_json_renderer_and_parser(monkeypatch, fast_library, create_bunch_consultation):
+    if not fast_library:
+        monkeypatch.setattr(renderers, "orjson", None)
+    values = ValuesSerializer.for_serializer(ConsultationsSerializer)
+    data = {
+        "results": values.to_representation(values.queryset(Consultations.objects.all())),
+        "raw": list(Consultations.objects.values()),
+        "moscow": datetime(2026, 6, 20, 10, 0, 0, 123456, tzinfo=ZoneInfo("Europe/Moscow")),
+        "day": date(2026, 6, 20),
+        "other": [uuid.UUID(int=1), Decimal("1.50"), timedelta(minutes=30), gettext_lazy("Заметка"), "a\u2028b"],
+        "counts": {1: 2},
+    }
+    rendered = renderers.FastJSONRenderer().render(data)
+    assert rendered == JSONRenderer().render(data)
+    assert renderers.FastJSONRenderer().render(data, "application/json; indent=4") == JSONRenderer().render(
+        data, "application/json; indent=4"
+    )
+
+    parser = renderers.FastJSONParser()
+    assert parser.parse(io.BytesIO(rendered)) == JSONParser().parse(io.BytesIO(rendered))
+    for body in [b"{", b'{"a": NaN}']:
+        with pytest.raises(ParseError):
+            parser.parse(io.BytesIO(body))
+
+
+@pytest.mark.django_db
+def test_bench_rendering_command(create_bunch_consultation):
+    stdout = io.StringIO()
+    call_command("bench_rendering", iterations=1, stdout=stdout)
+    assert "serialized page" in stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_bench_api_command(tmp_path):
+    output = tmp_path / "bench.json"
+    sizes = {"clinics": 2, "doctors": 3, "patients": 10, "consultations": 200}
+    call_command(
+        "bench_api", seed=True, workers=1, requests=2, warmup=0, output=str(output), stdout=io.StringIO(), **sizes
+    )
+
+    report = json.loads(output.read_text())
+    assert report["dataset"] == sizes
+    endpoints = {endpoint["name"]: endpoint for endpoint in report["endpoints"]}
+    assert {"token", "consultations.list", "async.doctors.free_slots", "consultations.import"} <= set(endpoints)
+    assert [name for name, endpoint in endpoints.items() if endpoint["errors"] or endpoint["requests"] != 2] == []
+    assert endpoints["consultations.detail"]["queries_max"] == 1
+    # the writes are rolled back
+    assert Consultations.objects.count() == sizes["consultations"]
+    assert Consultations.objects.filter(status="waiting").exists()
+
+    seeded = Consultations.objects.order_by("start_time")
+    assert all(start.minute in (0, 30) and start.hour >= 9 for start in seeded.values_list("start_time", flat=True))
+    today = datetime.combine(datetime.now(dt_timezone.utc).date(), time(), dt_timezone.utc)
+    assert set(seeded.filter(start_time__gte=today).values_list("status", flat=True)) <= {"waiting", "confirmed"}
+    assert seeded.filter(start_time__lt=today, status="paid").exists()
+
+
+@pytest.mark.django_db
+def test_seed_mis_command(monkeypatch):
+    # more than one chunk per table; workers are other processes, which can't see the test transaction
+    monkeypatch.setattr(seeding, "CHUNK_SIZE", 7)
+    stdout = io.StringIO()
+    call_command("seed_mis", clinics=3, doctors=4, patients=30, consultations=100, workers=1, stdout=stdout)
+    assert "3 clinics, 4 doctors, 30 patients, 100 consultations" in stdout.getvalue()
+
+    assert Users.objects.filter(role="doctor", doctor__isnull=False).count() == 4
+    assert Users.objects.filter(role="patient", patient__isnull=False).count() == 30
+    assert not Doctors.objects.filter(clinics__isnull=True).exists()
+    user = Users.objects.get(username=f"{seeding.USERNAME_PREFIX}patient.0")
+    assert user.check_password(seeding.SEED_PASSWORD)
+    consultations = Consultations.objects.all()
+    # the clinic is one of the doctor's
+    assert not consultations.exclude(clinic__doctors=F("doctor")).exists()
+    assert ConsultationStats.objects.aggregate(total=Sum("count"))["total"] == 100
+    # the ids were taken from the sequences, later rows come after them
+    last_patient = Patients.objects.order_by("-pk").first()
+    patient = Patients.objects.create(user=Users.objects.create(username="after_seed"))
+    assert patient.pk > last_patient.pk and patient.user_id > last_patient.user_id
+
+    with pytest.raises(CommandError, match="seeded already"):
+        call_command("seed_mis", clinics=1, doctors=1, patients=1, consultations=1, workers=1)
+
+
+@pytest.mark.django_db
+def test_bulk_import_consultations_csv(api_client_with_token, doctor, patient, clinic):
+    client, user = api_client_with_token(role="admin")
+    ids = f"{doctor.id},{patient.id},{clinic.id}"
+    body = "\n".join([
+        "doctor,patient,clinic,start_time,end_time,status,notes",
+        f"{ids},2026-06-20T10:00:00Z,,,",
+        f"{ids},2026-06-20T10:10:00Z,,,overlaps the first row",
+        f"{ids},2026-06-20T11:00:00Z,2026-06-20T12:00:00Z,confirmed,\"multi\nline\"",
+        f"{ids},not a date,,,",
+        f"{doctor.id},{patient.id},0,2026-06-20T13:00:00Z,,,",
+        f"{ids},2026-06-20T14:00:00Z,,unknown,",
+    ])
+    response = client.post("/api/consultations/import/", body, content_type="text/csv")
+
+    assert response.status_code == 200
+    assert response.data["created"] == 2
+    assert response.data["failed"] == 4
+    assert sorted(error["row"] for error in response.data["errors"]) == [2, 4, 5, 6]
+    first, second = Consultations.objects.order_by("start_time")
+    assert first.end_time - first.start_time == Consultations.DEFAULT_DURATION
+    assert first.status == "waiting"
+    assert (second.end_time - second.start_time, second.status, second.notes) == (
+        timedelta(hours=1), "confirmed", "multi\nline"
+    )
+
+
+@pytest.mark.django_db
+def test_bulk_import_overlaps_across_months(api_client_with_token, doctor, patient, clinic):
+    client, user = api_client_with_token(role="admin")
+    ids = f"{doctor.id},{patient.id},{clinic.id}"
+    body = "\n".join([
+        "doctor,patient,clinic,start_time,end_time",
+        f"{ids},2026-06-30T23:45:00Z,2026-07-01T00:45:00Z",
+        f"{ids},2026-07-01T00:15:00Z,",
+        f"{ids},2026-07-01T01:00:00Z,",
+    ])
+    response = client.post("/api/consultations/import/", body, content_type="text/csv")
+
+    assert response.status_code == 200
+    assert (response.data["created"], response.data["failed"]) == (2, 1)
+    assert response.data["errors"] == [{"row": 2, "errors": {"non_field_errors": [ConsultationOverlap.default_detail]}}]
+    assert Consultations.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_import_consultations_command(tmp_path, doctor, patient, clinic):
+    records = [
+        {"doctor": doctor.id, "patient": patient.id, "clinic": clinic.id, "start_time": f"2026-06-{day}T10:00:00Z"}
+        for day in range(10, 20)
+    ]
+    path = tmp_path / "consultations.ndjson"
+    path.write_text("\n".join([json.dumps(record) for record in records] + ["{broken", json.dumps(records[0])]))
+
+    call_command("import_consultations", str(path), chunk_size=3, stdout=io.StringIO(), stderr=io.StringIO())
+
+    assert Consultations.objects.count() == len(records)
+
+
+@pytest.mark.django_db
+def test_bulk_import_unsupported_media_type(api_client_with_token):
+    client, user = api_client_with_token(role="admin")
+    response = client.post("/api/consultations/import/", {}, format="json")
+    assert response.status_code == 415
+
+
+@pytest.mark.django_db
+def test_bulk_import_content_type_parameters(api_client_with_token, doctor, patient, clinic):
+    client, user = api_client_with_token(role="admin")
+    body = "doctor,patient,clinic,start_time,notes\n{},{},{},2026-06-20T10:00:00Z,Первичный приём".format(
+        doctor.id, patient.id, clinic.id
+    )
+    for content_type, charset in (("text/csv; charset=utf-8", "utf-8"), ("Text/CSV; charset=windows-1251", "cp1251")):
+        Consultations.objects.all().delete()
+        response = client.post("/api/consultations/import/", body.encode(charset), content_type=content_type)
+        assert response.data["created"] == 1
+        assert Consultations.objects.get().notes == "Первичный приём"
+    for charset in ("unknown", "base64"):
+        response = client.post("/api/consultations/import/", body, content_type=f"text/csv; charset={charset}")
+        assert response.status_code == 415
+
+
+@pytest.mark.django_db
+def test_export_consultations(api_client_with_token, create_bunch_consultation):
+    client, user = api_client_with_token(role="admin")
+    response = client.get("/api/consultations/export/?status=waiting")
+    assert response.status_code == 200
+    assert response.streaming
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert lines[0] == "id,doctor,patient,clinic,start_time,end_time,status,created_at,notes"
+    assert len(lines) == 2 and ",waiting," in lines[1]
+
+    response = client.get("/api/consultations/export/?export_format=ndjson&search=Иванов&ordering=start_time")
+    records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+    api_records = client.get("/api/consultations/?search=Иванов&ordering=start_time").data["results"]
+    assert [{key: record[key] for key in api_records[0]} for record in records] == api_records
+
+    response = client.get("/api/consultations/export/?export_format=xml")
+    assert response.status_code == 400
+
+
+PATIENT_DATA = {"user": {"first_name": "Иван", "middle_name": "Иванович", "last_name": "Иванов", "email": ""}}
+
+
+@pytest.mark.django_db
+def test_generated_usernames(api_client_with_token):
+    client, user = api_client_with_token(role="admin")
+    client.get("/api/users/")
+    queries = []
+    for _ in range(3):
+        with CaptureQueriesContext(connection) as context:
+            response = client.post("/api/users/", PATIENT_DATA, format="json")
+        assert response.status_code == 201
+        queries.append(len(context.captured_queries))
+    # the name is already taken by a user created without the counter
+    Users.objects.create_user(username="Иванов_ИИ_3")
+    response = client.post("/api/users/", PATIENT_DATA, format="json")
+    assert response.status_code == 201
+
+    usernames = Users.objects.filter(last_name="Иванов").order_by("id").values_list("username", flat=True)
+    assert list(usernames) == ["Иванов_ИИ", "Иванов_ИИ_1", "Иванов_ИИ_2", "Иванов_ИИ_4"]
+    assert len(set(queries)) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_username_generation(create_user):
+    admin = create_user(role="admin")
+
+    def register(_):
+        client = APIClient()
+        client.force_authenticate(admin)
+        try:
+            return client.post("/api/users/", PATIENT_DATA, format="json").status_code
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(register, range(16))) == {201}
+    assert Users.objects.filter(last_name="Иванов").values("username").distinct().count() == 16
+
+
+@pytest.mark.django_db
+def test_trigram_search(api_client_with_token, create_patient, create_doctor, create_bunch_consultation):
+    client, user = api_client_with_token(role="admin")
+    for last_name in ["Петров", "Петровский", "Сидоров"]:
+        patient = create_patient()
+        patient.user.last_name = last_name
+        patient.user.save()
+
+    # a typo still finds the names, the closest ones first
+    response = client.get("/api/users/?search=Петроф")
+    assert sorted(row["user"]["last_name"] for row in response.data["results"]) == ["Петров", "Петровский"]
+    response = client.get("/api/users/?search=Петровс")
+    assert [row["user"]["last_name"] for row in response.data["results"]] == ["Петровский", "Петров"]
+    response = client.get("/api/doctors/?search=Иваноф")
+    assert [row["user"]["last_name"] for row in response.data["results"]] == ["Иванов"]
+
+    response = client.get("/api/consultations/?search=Петров&search_type=patient")
+    assert response.data["count"] == 0
+    response = client.get("/api/consultations/?search=Петров")
+    assert response.data["count"] == 2
+
+
+@pytest.fixture
+def seed_consultations(clinic):
+    def _seed_users(cursor, role, count, insert):
+        cursor.execute(
+            f"""
+            WITH users AS (
+                INSERT INTO mis_users (password, is_superuser, username, first_name, last_name, middle_name, email,
+                                       is_staff, is_active, date_joined, role)
+                SELECT '!', false, %(role)s || '_' || i || '_' || md5(random()::text), 'Имя ' || i,
+                       'Фамилия ' || i, 'Отчество ' || i, '', false, true, now(), %(role)s
+                FROM generate_series(1, %(count)s) i
+                RETURNING id
+            )
+            {insert} FROM users RETURNING id
+            """,
+            {"role": role, "count": count},
+        )
+        return [pk for pk, in cursor.fetchall()]
+
+    def _seed_consultations(count, doctors=(), doctors_count=500, patients_count=5000):
+        with connection.cursor() as cursor:
+            doctor_ids = [doctor.id for doctor in doctors] + _seed_users(
+                cursor,
+                "doctor",
+                doctors_count - len(doctors),
+                "INSERT INTO mis_doctors (user_id, specialization) SELECT id, 'Терапевт'",
+            )
+            patient_ids = _seed_users(
+                cursor, "patient", patients_count, "INSERT INTO mis_patients (user_id) SELECT id"
+            )
+            # one consultation per doctor per hour, mostly paid history with a few active ones
+            cursor.execute(
+                """
+                INSERT INTO mis_consultations
+                    (doctor_id, patient_id, clinic_id, start_time, end_time, status, created_at, updated_at)
+                SELECT (%(doctors)s::bigint[])[1 + i %% cardinality(%(doctors)s::bigint[])],
+                       (%(patients)s::bigint[])[1 + i * 7919 %% cardinality(%(patients)s::bigint[])], %(clinic)s,
+                       start_time, start_time + interval '30 minutes',
+                       COALESCE((ARRAY['waiting', 'confirmed', 'started', 'finished'])[1 + i %% 40], 'paid'),
+                       start_time, start_time
+                FROM generate_series(0, %(count)s - 1) i,
+                     LATERAL (SELECT now() - interval '1 hour' * (i / cardinality(%(doctors)s::bigint[]))) t(start_time)
+                """,
+                {"doctors": doctor_ids, "patients": patient_ids, "clinic": clinic.id, "count": count},
+            )
+            cursor.execute("ANALYZE")
+
+    return _seed_consultations
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url",
+    [
+        # the examples from README.md
+        "/api/consultations/?status=finished",
+        "/api/consultations/?ordering=start_time&status=confirmed",
+        "/api/consultations/?search=Петров&search_type=doctor",
+        "/api/consultations/?search=Петроф",
+        "/api/consultations/?cursor=&limit=50",
+        # the other filters and orderings of ConsultationViewSet
+        "/api/consultations/?status__in=waiting,confirmed,started",
+        "/api/consultations/?doctor__user__last_name=Иванов",
+        "/api/consultations/?status=waiting&doctor__user__last_name=Иванов&ordering=start_time",
+        "/api/consultations/?cursor=&ordering=-created_at",
+        "/api/consultations/calendar/?clinic={clinic}&from=2026-06-22T00:00:00Z&to=2026-06-29T00:00:00Z",
+    ],
+)
+def test_query_plans_use_indexes(api_client_with_token, create_doctor, clinic, seed_consultations, url):
+    doctors = [create_doctor(), create_doctor()]
+    for doctor, last_name in zip(doctors, ["Иванов", "Петров"]):
+        doctor.user.last_name = last_name
+        doctor.user.save()
+    seed_consultations(20000, doctors)
+    client, user = api_client_with_token(role="admin")
+
+    with CaptureQueriesContext(connection) as context:
+        assert client.get(url.format(clinic=clinic.id)).status_code == 200
+    with connection.cursor() as cursor:
+        for query in context.captured_queries:
+            if "mis_consultations" not in query["sql"]:
+                continue
+            cursor.execute(f"EXPLAIN {query['sql']}")
+            plan = "\n".join(row for row, in cursor.fetchall())
+            # empty partitions are scanned at no cost
+            scanned = re.findall(r"Seq Scan on (mis_consultations\w*)", plan)
+            cursor.execute("SELECT relname FROM pg_class WHERE relname = ANY(%s) AND reltuples > 0", [scanned])
+            assert not cursor.fetchall(), f"{query['sql']}\n{plan}"
+
+
+@pytest.mark.django_db
+def test_cached_clinics(api_client_with_token, clinic, create_clinic):
+    create_clinic()
+    client, user = api_client_with_token(role="admin")
+    response = client.get("/api/clinics/")
+    assert response.status_code == 200
+    etag = response["ETag"]
+
+    with CaptureQueriesContext(connection) as context:
+        assert client.get("/api/clinics/").data == response.data
+        assert client.get("/api/clinics/", HTTP_IF_NONE_MATCH=etag).status_code == 304
+        response = client.get(f"/api/clinics/{clinic.id}/")
+        not_modified = client.get(f"/api/clinics/{clinic.id}/", HTTP_IF_NONE_MATCH=response["ETag"])
+        assert not_modified.status_code == 304
+        # Last-Modified has whole seconds, a write in the same second would not move it
+        modified_since = client.get(f"/api/clinics/{clinic.id}/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        assert modified_since.status_code == 200
+    assert len(context.captured_queries) == 1
+
+    # parameters the view doesn't use are left out of the cache key and the links
+    with CaptureQueriesContext(connection) as context:
+        responses = [client.get("/api/clinics/", {"x": get_random_string(8), "limit": 1}) for _ in range(3)]
+    assert len({response["ETag"] for response in responses}) == 1
+    assert len(context.captured_queries) == 2
+    assert "x=" not in responses[0].data["next"]
+    assert client.get("/api/clinics/", {"limit": 1})["ETag"] == responses[0]["ETag"]
+
+    # credentials are checked on anonymous reads as well
+    assert APIClient().get("/api/clinics/").status_code == 200
+    assert APIClient().get("/api/clinics/", HTTP_AUTHORIZATION="Bearer invalid").status_code == 401
+
+    response = client.patch(f"/api/clinics/{clinic.id}/", {"name": "Клиника 2"})
+    assert response.status_code == 200
+    response = client.get("/api/clinics/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert "Клиника 2" in [result["name"] for result in response.data["results"]]
+
+
+@pytest.mark.skipif("pool" not in django_settings.DATABASES["default"].get("OPTIONS", {}), reason="POSTGRES_POOL=False")
+@pytest.mark.django_db(transaction=True)
+def test_connections_are_pooled():
+    backend_pids = set()
+    for _ in range(10):
+        connection.ensure_connection()
+        backend_pids.add(connection.connection.info.backend_pid)
+        connection.close()
+    assert len(backend_pids) <= django_settings.DATABASES["default"]["OPTIONS"]["pool"]["max_size"]
+
+
+@pytest.mark.django_db
+def test_bench_connections_command():
+    stdout = io.StringIO()
+    call_command("bench_connections", iterations=5, stdout=stdout)
+    assert "Pooling saves" in stdout.getvalue()
+
+
+def _stats_from_consultations():
+    return sorted(
+        (row["clinic_id"], row["doctor_id"], row["start_time__date"], row["status"], row["count"])
+        for row in Consultations.objects.order_by()
+        .values("clinic_id", "doctor_id", "start_time__date", "status")
+        .annotate(count=Count("id"))
+    )
+
+
+def _stats():
+    return sorted(ConsultationStats.objects.values_list("clinic_id", "doctor_id", "day", "status", "count"))
+
+
+@pytest.mark.django_db
+def test_consultation_stats_follow_writes(api_client_with_token, create_doctor, patient, create_clinic):
+    doctors, clinics = [create_doctor(), create_doctor()], [create_clinic(), create_clinic()]
+    start = datetime.fromisoformat("2026-06-20T09:00:00Z")
+    consultations = [
+        Consultations.objects.create(
+            doctor=doctors[i % 2], patient=patient, clinic=clinics[i % 3 % 2], start_time=start + timedelta(hours=i * 7)
+        )
+        for i in range(8)
+    ]
+    client, user = api_client_with_token(role="admin")
+    client.post(f"/api/consultations/{consultations[0].id}/change_status/", {"status": "confirmed"})
+    ids = [consultation.id for consultation in consultations]
+    client.post("/api/consultations/change_status/", {"status": "confirmed", "ids": ids}, format="json")
+    client.patch(f"/api/consultations/{consultations[1].id}/", {"start_time": "2026-07-01T10:00:00Z"})
+    client.patch(f"/api/consultations/{consultations[2].id}/", {"notes": "no change of the stats"})
+    client.delete(f"/api/consultations/{consultations[3].id}/")
+    csv_body = f"doctor,patient,clinic,start_time\n{doctors[0].id},{patient.id},{clinics[1].id},2026-06-20T09:00:00Z\n"
+    csv_body += f"{doctors[0].id},{patient.id},{clinics[1].id},2026-08-01T09:00:00Z\n"
+    client.post("/api/consultations/import/", csv_body, content_type="text/csv")
+    assert len(_stats_from_consultations()) > 4
+    assert _stats() == _stats_from_consultations()
+
+    # cascades are counted too, the emptied rows are removed
+    deleted_doctor_id = doctors[1].id
+    doctors[1].delete()
+    assert _stats() == _stats_from_consultations()
+    assert not ConsultationStats.objects.filter(doctor_id=deleted_doctor_id).exists()
+
+    ConsultationStats.objects.update(count=100)
+    call_command("rebuild_consultation_stats", stdout=io.StringIO())
+    assert _stats() == _stats_from_consultations()
+
+
+@pytest.mark.django_db
+def test_analytics(api_client_with_token, create_doctor, patient, clinic):
+    doctor, other = create_doctor(), create_doctor()
+    start = datetime.fromisoformat("2026-06-20T09:00:00Z")
+    for i, status in enumerate(["waiting", "waiting", "paid", "finished"]):
+        Consultations.objects.create(
+            doctor=doctor if i < 3 else other, patient=patient, clinic=clinic, status=status,
+            start_time=start + timedelta(hours=i if i < 2 else 24),
+        )
+    client, user = api_client_with_token(role="admin")
+    client.get("/api/analytics/?from=2026-06-20&to=2026-06-20")
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get("/api/analytics/", {"from": "2026-06-20", "to": "2026-06-21"})
+    assert response.status_code == 200
+    assert len(queries) == 1
+    assert [(row["doctor"], row["day"], row["counts"]["waiting"], row["counts"]["paid"]) for row in response.data] == [
+        (doctor.id, date(2026, 6, 20), 2, 0),
+        (doctor.id, date(2026, 6, 21), 0, 1),
+        (other.id, date(2026, 6, 21), 0, 0),
+    ]
+
+    response = client.get("/api/analytics/", {"from": "2026-06-01", "to": "2026-06-30", "group_by": "clinic"})
+    assert response.data == [
+        {"clinic": clinic.id, "counts": {"waiting": 2, "confirmed": 0, "started": 0, "finished": 1, "paid": 1}}
+    ]
+    response = client.get("/api/analytics/", {"from": "2026-06-21", "to": "2026-06-21", "doctor": other.id})
+    assert [row["counts"]["finished"] for row in response.data] == [1]
+    assert client.get("/api/analytics/", {"from": "2026-06-21", "to": "2026-06-20"}).status_code == 400
+
+
+def _partition_of(consultation):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT tableoid::regclass::text FROM mis_consultations WHERE id = %s", [consultation.id])
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def test_consultation_partitions(api_client_with_token, doctor, patient, clinic):
+    this_month = month_start(timezone.now().date())
+    old_month, unpaid_month = add_months(this_month, -14), add_months(this_month, -13)
+    paid = Consultations.objects.create(
+        doctor=doctor, patient=patient, clinic=clinic, status="paid",
+        start_time=datetime(old_month.year, old_month.month, 10, 9, tzinfo=dt_timezone.utc),
+    )
+    unpaid = Consultations.objects.create(
+        doctor=doctor, patient=patient, clinic=clinic, status="finished",
+        start_time=datetime(unpaid_month.year, unpaid_month.month, 10, 9, tzinfo=dt_timezone.utc),
+    )
+    assert _partition_of(paid) == "mis_consultations_default"
+    stats = _stats()
+
+    # the rows of a new partition are moved out of the default one without touching the stats
+    assert ensure_partitions(old_month, unpaid_month) == [partition_name(old_month), partition_name(unpaid_month)]
+    assert _partition_of(paid) == partition_name(old_month)
+    assert _stats() == stats
+
+    stdout = io.StringIO()
+    call_command("manage_consultation_partitions", months_ahead=6, stdout=stdout)
+    with connection.cursor() as cursor:
+        assert {add_months(this_month, i) for i in range(7)} <= monthly_partitions(cursor).keys()
+    call_command("manage_consultation_partitions", months_ahead=6, stdout=stdout)
+    assert stdout.getvalue().endswith("Created 0 partitions\n")
+
+    # recent reads only scan recent partitions
+    week = datetime.combine(this_month, time(), dt_timezone.utc) + timedelta(days=7)
+    recent = Consultations.objects.filter(start_time__range=(week - timedelta(days=7), week))
+    plan = recent.explain()
+    assert partition_name(this_month) in plan
+    assert partition_name(old_month) not in plan and "mis_consultations_default" not in plan
+
+    # a consultation moved to another month changes partition
+    client, user = api_client_with_token(role="admin")
+    response = client.patch(f"/api/consultations/{unpaid.id}/", {"start_time": f"{this_month}T10:00:00Z"})
+    assert response.status_code == 200
+    assert _partition_of(unpaid) == partition_name(this_month)
+    assert _stats() == _stats_from_consultations()
+
+    # a consultation may run into the next month, where it's checked against the consultations of that month
+    next_month = add_months(this_month, 1)
+    last_day = next_month - timedelta(days=1)
+    data = {"doctor": doctor.id, "patient": patient.id, "clinic": clinic.id}
+    assert client.post("/api/consultations/", {**data, "start_time": f"{next_month}T00:30:00Z"}).status_code == 201
+    crossing = {**data, "start_time": f"{last_day}T23:45:00Z", "end_time": f"{next_month}T00:45:00Z"}
+    assert client.post("/api/consultations/", crossing).status_code == 409
+    body = "doctor,patient,clinic,start_time,end_time\n" + ",".join(map(str, crossing.values()))
+    response = client.post("/api/consultations/import/", body, content_type="text/csv")
+    assert (response.data["created"], response.data["failed"]) == (0, 1)
+    response = client.post("/api/consultations/", {**data, "start_time": f"{last_day}T23:45:00Z"})
+    assert response.status_code == 201
+    assert response.data["end_time"] == f"{next_month}T00:15:00Z"
+    assert client.post("/api/consultations/", {**data, "start_time": f"{next_month}T00:00:00Z"}).status_code == 409
+    slot = {**data, "start_time": f"{next_month}T00:15:00Z", "end_time": f"{next_month}T00:30:00Z"}
+    assert client.post("/api/consultations/", slot).status_code == 201
+
+    unpaid.refresh_from_db()
+    unpaid.start_time = datetime(unpaid_month.year, unpaid_month.month, 10, 9, tzinfo=dt_timezone.utc)
+    unpaid.end_time = None
+    unpaid.save()
+    call_command("manage_consultation_partitions", months_ahead=0, archive_after=12, stdout=stdout)
+    assert f"Archived archive.{partition_name(old_month)}" in stdout.getvalue()
+    assert f"Kept {partition_name(unpaid_month)}" in stdout.getvalue()
+    assert not Consultations.objects.filter(pk=paid.pk).exists()
+    assert Consultations.objects.filter(pk=unpaid.pk).exists()
+    # archived consultations stay in the stats
+    assert ConsultationStats.objects.filter(day=paid.start_time.date(), status="paid").exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_booking_across_months(create_user, doctor, patient, clinic):
+    admin = create_user(role="admin")
+    next_month = add_months(month_start(timezone.now().date()), 1)
+    last_day = next_month - timedelta(days=1)
+    # every booking overlaps every other one, only some of them in the same month
+    slots = [f"{last_day}T23:45:00Z", f"{next_month}T00:00:00Z", f"{last_day}T23:50:00Z", f"{next_month}T00:05:00Z"]
+
+    def book(start_time):
+        client = APIClient()
+        client.force_authenticate(admin)
+        data = {"doctor": doctor.id, "patient": patient.id, "clinic": clinic.id, "start_time": start_time}
+        try:
+            return client.post("/api/consultations/", data).status_code
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        codes = list(pool.map(book, slots * 8))
+
+    assert sorted(codes) == [201] + [409] * (len(codes) - 1)
+    assert Consultations.objects.count() == 1
+
+
+def _waiting_for_lock(table):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_locks WHERE relation = %s::regclass AND NOT granted)", [table])
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_archive_partitions_with_concurrent_writer(doctor, patient, clinic):
+    this_month = month_start(timezone.now().date())
+    old_month = add_months(this_month, -14)
+    ensure_partitions(old_month, this_month)
+    recent, paid = (
+        Consultations.objects.create(
+            doctor=doctor, patient=patient, clinic=clinic, status=status,
+            start_time=datetime(month.year, month.month, 10, 9, tzinfo=dt_timezone.utc),
+        )
+        for month, status in ((this_month, "waiting"), (old_month, "paid"))
+    )
+    writing = threading.Event()
+
+    def write():
+        try:
+            with transaction.atomic():
+                # a write locks the parent table, then only the partition it touches
+                Consultations.objects.filter(pk=recent.pk, start_time=recent.start_time).update(notes="first")
+                writing.set()
+                deadline = timezone.now() + timedelta(seconds=10)
+                while not _waiting_for_lock(PARENT) and timezone.now() < deadline:
+                    sleep(0.05)
+                # the archiving waits for the parent table, the old partition is still free to write
+                Consultations.objects.filter(pk=paid.pk, start_time=paid.start_time).update(notes="second")
+        finally:
+            connection.close()
+
+    def archive():
+        try:
+            return archive_partitions(add_months(this_month, -12))
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        writer = pool.submit(write)
+        assert writing.wait(10)
+        archiver = pool.submit(archive)
+        writer.result()
+        archived, kept = archiver.result()
+
+    assert f"archive.{partition_name(old_month)}" in archived
+    assert kept == []
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT notes FROM archive.{partition_name(old_month)} WHERE id = %s", [paid.pk])
+        assert cursor.fetchone() == ("second",)
+        cursor.execute(f"DROP TABLE {', '.join(archived)}")
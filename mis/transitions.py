@@ -0,0 +1,55 @@
+from django.db import connection
+
+from mis.models import Consultations
+
+NOT_FOUND = "Not found."
+MODIFIED = "The consultation has been modified."
+INVALID_TRANSITION = "Can't change status from '{current}' to '{status}'."
+
+
+def change_status(ids: list[int], status: str, unmodified_since=None) -> list[dict]:
+    """
+    Moves consultations to `status` along `Consultations.STATUS_TRANSITIONS` in one conditional UPDATE.
+
+    Returns a result per distinct id in the request order. Consultations in any other status stay as they are,
+    the condition is checked by the UPDATE itself, so a concurrent transition can't be overwritten.
+    With `unmodified_since` only consultations whose `updated_at` is still that value are changed.
+    """
+    ids = list(dict.fromkeys(ids))
+    table = Consultations._meta.db_table
+    with connection.cursor() as cursor:
+        # the SELECT sees the rows as they were before the UPDATE, i.e. the status a rejected row is in
+        cursor.execute(
+            f"WITH updated AS ("
+            f"  UPDATE {table} SET status = %(status)s, updated_at = now()"
+            "  WHERE id = ANY(%(ids)s::bigint[]) AND status = ANY(%(predecessors)s::varchar[])"
+            "    AND (%(unmodified_since)s::timestamptz IS NULL OR updated_at = %(unmodified_since)s)"
+            "  RETURNING id, updated_at"
+            ") "
+            "SELECT requested.id, c.status, COALESCE(updated.updated_at, c.updated_at), updated.id IS NOT NULL "
+            "FROM unnest(%(ids)s::bigint[]) WITH ORDINALITY AS requested(id, position) "
+            f"LEFT JOIN {table} c ON c.id = requested.id "
+            "LEFT JOIN updated ON updated.id = requested.id "
+            "ORDER BY requested.position",
+            {
+                "status": status,
+                "ids": ids,
+                "predecessors": list(Consultations.STATUS_TRANSITIONS.get(status, ())),
+                "unmodified_since": unmodified_since,
+            },
+        )
+        rows = cursor.fetchall()
+
+    results = []
+    for pk, current, updated_at, updated in rows:
+        if updated:
+            results.append({"id": pk, "status": status, "updated_at": updated_at, "updated": True})
+        elif current is None:
+            results.append({"id": pk, "updated": False, "error": NOT_FOUND})
+        else:
+            if unmodified_since is not None and updated_at != unmodified_since:
+                error = MODIFIED
+            else:
+                error = INVALID_TRANSITION.format(current=current, status=status)
+            results.append({"id": pk, "status": current, "updated_at": updated_at, "updated": False, "error": error})
+    return results
@@ -2,15 +2,21 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from mis.views import ConsultationViewSet, PatientsViewSet, ClinicsViewSet, DoctorsViewSet
+from mis.async_views import AsyncConsultationDetailView, AsyncConsultationListView, AsyncDoctorFreeSlotsView
+from mis.views import AnalyticsViewSet, ConsultationViewSet, PatientsViewSet, ClinicsViewSet, DoctorsViewSet
 
 router = DefaultRouter()
 router.register(r"clinics", ClinicsViewSet)
 router.register(r"consultations", ConsultationViewSet)
 router.register(r"users", PatientsViewSet)
 router.register(r"doctors", DoctorsViewSet)
+router.register(r"analytics", AnalyticsViewSet, basename="analytics")
 
 urlpatterns = [
     path("", include(router.urls)),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair')
+    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    # the same reads on the async ORM, for the ASGI deployment
+    path("async/consultations/", AsyncConsultationListView.as_view(), name="async-consultations-list"),
+    path("async/consultations/<pk>/", AsyncConsultationDetailView.as_view(), name="async-consultations-detail"),
+    path("async/doctors/<pk>/free-slots/", AsyncDoctorFreeSlotsView.as_view(), name="async-doctors-free-slots"),
 ]
@@ -1,11 +1,29 @@
 # Create your views here.
+import codecs
+from datetime import timedelta
+
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.db.models import F, Prefetch, Sum
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils.http import parse_etags, parse_header_parameters
 from django_filters.rest_framework.backends import DjangoFilterBackend
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.exceptions import UnsupportedMediaType
+from rest_framework.filters import OrderingFilter
 from rest_framework.response import Response
-from mis.models import Consultations
-from mis import serializers, models
+from mis import exporters
+from mis.caching import CachedReadMixin, ConditionalListMixin
+from mis.fast_serializers import ValuesListMixin
+from mis.filters import TrigramSearchFilter
+from mis.importers import import_consultations, read_records
+from mis.models import Consultations, TsTzRange
+from mis.pagination import KeysetOrLimitOffsetPagination
+from mis.routers import ReplicaReadsMixin
+from mis.sparse import SparseFieldsViewMixin
+from mis import serializers, models, transitions
+from mis.slots import free_slots
 
 
 class IsAdminOrReadOnly(permissions.BasePermission):
@@ -24,39 +42,235 @@ class IsAdmin(permissions.BasePermission):
         return False
 
 
-class PatientsViewSet(viewsets.ModelViewSet):
-    queryset = models.Patients.objects.filter(user__role="patient")
+class PatientsViewSet(ReplicaReadsMixin, SparseFieldsViewMixin, ValuesListMixin, viewsets.ModelViewSet):
+    queryset = models.Patients.objects.filter(user__role="patient").select_related("user")
     serializer_class = serializers.PatientSerializer
     permission_classes = [IsAdmin]
+    filter_backends = [TrigramSearchFilter, OrderingFilter]
+    trigram_search_fields = {"patient": "user"}
+    trigram_search_rank = True
 
 
-class DoctorsViewSet(viewsets.ModelViewSet):
+class DoctorsViewSet(ReplicaReadsMixin, SparseFieldsViewMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = models.Doctors.objects.all()
     serializer_class = serializers.DoctorSerializer
     permission_classes = [IsAdmin]
+    filter_backends = [TrigramSearchFilter, OrderingFilter]
+    trigram_search_fields = {"doctor": "user"}
+    trigram_search_rank = True
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == "free_slots":
+            return queryset
+        # the nested user and clinic ids are serialized for every doctor, clinic ids in the order of the list fast path
+        return queryset.select_related("user").prefetch_related(
+            Prefetch("clinics", queryset=models.Clinics.objects.order_by("pk"))
+        )
+
+    @staticmethod
+    def busy_intervals(doctor, start, end):
+        # the doctor is busy regardless of the clinic the consultation is booked in. A NULL end_time lasts
+        # the default duration like in save(); the range stays the indexed one, where NULL is open-ended
+        return (
+            Consultations.objects.annotate(
+                period=TsTzRange("start_time", "end_time"),
+                busy_end=Coalesce("end_time", F("start_time") + Consultations.DEFAULT_DURATION),
+            )
+            .filter(doctor=doctor, period__overlap=DateTimeTZRange(start, end), busy_end__gt=start)
+            .order_by("start_time")
+            .values_list("start_time", "busy_end")
+        )
 
+    @action(detail=True, methods=["get"], url_path="free-slots")
+    def free_slots(self, request, pk=None):
+        doctor = self.get_object()
+        query = serializers.FreeSlotsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end = query.validated_data["from"], query.validated_data["to"]
+        clinic = query.validated_data.get("clinic")
+        if clinic and not doctor.clinics.filter(pk=clinic.pk).exists():
+            return Response({"error": "Doctor does not work in this clinic"}, status=status.HTTP_400_BAD_REQUEST)
 
-class ClinicsViewSet(viewsets.ModelViewSet):
+        busy = self.busy_intervals(doctor, start, end)
+        slots = free_slots(busy, start, end, timedelta(minutes=query.validated_data["duration"]))
+        data = [{"start_time": slot_start, "end_time": slot_end} for slot_start, slot_end in slots]
+        return Response(serializers.FreeSlotSerializer(data, many=True).data)
+
+
+class ClinicsViewSet(CachedReadMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
+    # reads stay on the primary: a lagging replica read right after an invalidation would be cached for the day
+    cache_namespace = "clinics"
     queryset = models.Clinics.objects.all()
     serializer_class = serializers.ClinicSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
-class ConsultationViewSet(viewsets.ModelViewSet):
+class AnalyticsViewSet(ReplicaReadsMixin, viewsets.GenericViewSet):
+    queryset = models.ConsultationStats.objects.all()
+    permission_classes = [IsAdmin]
+
+    def list(self, request):
+        query = serializers.AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        group_by = params["group_by"]
+
+        # only the rollup is read, the cost depends on the range and not on the consultations history
+        stats = self.get_queryset().filter(day__range=(params["from"], params["to"]))
+        for field in ("clinic", "doctor"):
+            if field in params:
+                stats = stats.filter(**{f"{field}_id": params[field]})
+        rows = stats.values_list(*group_by, "status").annotate(total=Sum("count")).order_by(*group_by)
+
+        counts = {}
+        for *key, consultation_status, total in rows:
+            group = counts.setdefault(tuple(key), dict.fromkeys(dict(Consultations.STATUS_CHOICES), 0))
+            group[consultation_status] = total
+        return Response([{**dict(zip(group_by, key)), "counts": value} for key, value in counts.items()])
+
+
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def _text_encoding(charset):
+    """The codec name of `charset`, None if it isn't a known text encoding."""
+    try:
+        # base64, zlib and the like are codecs as well, but don't decode bytes to text
+        text = codecs.getincrementaldecoder(charset)().decode(b"", final=True)
+    except (LookupError, TypeError, ValueError):
+        return None
+    return codecs.lookup(charset).name if isinstance(text, str) else None
+
+
+class ConsultationViewSet(
+    ReplicaReadsMixin, SparseFieldsViewMixin, ConditionalListMixin, ValuesListMixin, viewsets.ModelViewSet
+):
     queryset = models.Consultations.objects.all()
     serializer_class = serializers.ConsultationsSerializer
     permission_classes = [IsAdmin]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    filterset_fields = ["status", "created_at", "doctor__user__last_name", "patient__user__last_name"]
-    search_fields = ["doctor__user__last_name", "patient__user__last_name"]
+    pagination_class = KeysetOrLimitOffsetPagination
+    filter_backends = [DjangoFilterBackend, TrigramSearchFilter, OrderingFilter]
+    filterset_fields = {
+        "status": ["exact", "in"],
+        "created_at": ["exact"],
+        "doctor__user__last_name": ["exact"],
+        "patient__user__last_name": ["exact"],
+    }
+    trigram_search_fields = {"doctor": "doctor__user", "patient": "patient__user"}
     ordering_fields = ['created_at', 'start_time']
+    # the ETag of retrieve
+    sparse_required_fields = ("updated_at",)
+
+    def get_unmodified_since(self, request, instance):
+        """`updated_at` the client has seen according to If-Match, None without the header. 412 if it is stale."""
+        if_match = request.headers.get("If-Match")
+        if if_match is None:
+            return None
+        etags = parse_etags(if_match)
+        if "*" in etags:
+            return None
+        if instance.etag not in etags:
+            raise serializers.PreconditionFailed()
+        return instance.updated_at
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return Response(self.get_serializer(instance).data, headers={"ETag": instance.etag})
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop("partial", False)
+        instance = self.get_object()
+        unmodified_since = self.get_unmodified_since(request, instance)
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.context["unmodified_since"] = unmodified_since
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        return Response(serializer.data, headers={"ETag": serializer.instance.etag})
 
     @action(detail=True, methods=["post"])
     def change_status(self, request, pk=None):
         consultation = self.get_object()
+        unmodified_since = self.get_unmodified_since(request, consultation)
         new_status = request.data.get("status")
         if new_status not in dict(Consultations.STATUS_CHOICES):
             return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
-        consultation.status = new_status
-        consultation.save()
-        return Response({"status": "Status updated"})
+        result, = transitions.change_status([consultation.pk], new_status, unmodified_since)
+        if result.get("error") == transitions.MODIFIED:
+            raise serializers.PreconditionFailed()
+        if not result["updated"]:
+            return Response({"error": result["error"]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"status": "Status updated"}, headers={"ETag": Consultations.etag_for(result["updated_at"])})
+
+    @action(detail=False, methods=["post"], url_path="change_status")
+    def bulk_change_status(self, request):
+        serializer = serializers.StatusTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({"results": transitions.change_status(**serializer.validated_data)})
+
+    @action(detail=False, methods=["get"])
+    def calendar(self, request):
+        query = serializers.CalendarQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        start, end = query.validated_data["from"], query.validated_data["to"]
+
+        # plain tuples from a range scan of consultation_clinic_start_idx, no model instances
+        rows = (
+            Consultations.objects.filter(
+                clinic=query.validated_data["clinic"], start_time__gte=start, start_time__lt=end
+            )
+            .order_by("start_time")
+            .values_list("doctor_id", "start_time", "end_time", "status", "patient_id")
+        )
+        status_codes = {value: code for code, (value, _) in enumerate(Consultations.STATUS_CHOICES)}
+        # offsets are whole minutes from `from`, statuses are indexes in `statuses`
+        minute = timedelta(minutes=1)
+        doctors = {}
+        for doctor, start_time, end_time, consultation_status, patient in rows:
+            if doctor not in doctors:
+                doctors[doctor] = {"doctor": doctor, "start": [], "end": [], "status": [], "patient": []}
+            columns = doctors[doctor]
+            columns["start"].append((start_time - start) // minute)
+            # end_time may be NULL for rows written past save(), e.g. by update() or raw SQL
+            end_time = Consultations.default_end_time(start_time, end_time)
+            columns["end"].append((end_time - start) // minute)
+            columns["status"].append(status_codes[consultation_status])
+            columns["patient"].append(patient)
+        return Response({
+            "from": start,
+            "statuses": list(status_codes),
+            "doctors": [doctors[doctor] for doctor in sorted(doctors)],
+        })
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def bulk_import(self, request):
+        media_type, params = parse_header_parameters(request.content_type)
+        fmt = IMPORT_CONTENT_TYPES.get(media_type)
+        if fmt is None:
+            raise UnsupportedMediaType(request.content_type)
+        encoding = _text_encoding(params.get("charset", "utf-8"))
+        if encoding is None:
+            raise UnsupportedMediaType(request.content_type, f'Unsupported charset "{params["charset"]}" in request.')
+        # the body is read line by line instead of request.data, so large uploads are never held in memory
+        lines = codecs.iterdecode(request.stream or [], encoding)
+        result = import_consultations(read_records(lines, fmt))
+        return Response(result.as_dict())
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        fmt = request.query_params.get("export_format", "csv")
+        if fmt not in exporters.FORMATS:
+            return Response({"error": "Invalid export_format"}, status=status.HTTP_400_BAD_REQUEST)
+        # a server-side cursor keeps memory flat and the first rows are sent before the query is exhausted
+        rows = self.filter_queryset(self.get_queryset()).values_list(*exporters.COLUMNS)
+        # the rows are read after the view has returned, so the database is chosen now
+        rows = rows.using(rows.db)
+        return StreamingHttpResponse(
+            exporters.export_consultations(rows.iterator(chunk_size=exporters.CHUNK_SIZE), fmt),
+            content_type=exporters.FORMATS[fmt],
+            headers={"Content-Disposition": f'attachment; filename="consultations.{fmt}"'},
+        )